@@ -4,11 +4,25 @@ A source is a class that provides up-to-date financial data. This could be a
 web API, a local database, or a CSV file. The source is responsible for
 downloading and parsing the data into a format that can be used by the
 portfolio tracker.
+
+Every data source method a subclass defines is timed into a "datasource.<method>" latency histogram labelled with the
+source's class, and its exceptions counted in "datasource.errors" (see metrics.py).
 """
+import functools
+import threading
 import time
 from abc import ABC, abstractmethod
 from random import random
 
+import metrics
+
+INSTRUMENTED = ("download_historical_data", "get_latest_price", "get_latest_prices", "get_securities")
+
+
+def backoff_delay(attempt, base_delay, jitter):
+    """Seconds to wait before retrying after the given (zero based) failed attempt."""
+    return (2 ** attempt + random() * jitter) * base_delay
+
 
 def exponential_backoff(max_retries, base_delay, jitter, func, *args, **kwargs):
     """Exponential backoff for a function that returns a value or None."""
@@ -16,23 +30,58 @@ def exponential_backoff(max_retries, base_delay, jitter, func, *args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as e:
-            delay = (2 ** attempt + random() * jitter) * base_delay
-            print(f"Error: {e}. Retrying in {delay:.2f} seconds...")
+            if attempt + 1 == max_retries:
+                break  # no point waiting when there is no retry to wait for
+            delay = backoff_delay(attempt, base_delay, jitter)
+            metrics.increment("retries", function=getattr(func, "__name__", type(func).__name__),
+                              error=type(e).__name__)
             time.sleep(delay)
+    metrics.increment("failures", function=getattr(func, "__name__", type(func).__name__))
     print(f"Failed after {max_retries} attempts.")
     return None
 
 
+def _instrument(method, func):
+    """Wrap a data source method so its calls are timed and its errors counted."""
+    @functools.wraps(func)
+    def call(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        except Exception:
+            metrics.increment("datasource.errors", method=method, source=type(self).__name__)
+            raise
+        finally:
+            metrics.observe(f"datasource.{method}", time.perf_counter() - started, source=type(self).__name__)
+    call.instrumented = True
+    return call
+
+
 class IDataSource(ABC):
-    """Abstract base class for sources to implement."""
+    """Abstract base class for sources to implement.
+
+    max_concurrency and requests_per_second bound how hard the fetch scheduler (DataSources.fetch) may hit the
+    source. Implementations override them per class or per instance; a requests_per_second of None means unlimited.
+    """
+
+    max_concurrency = 4
+    requests_per_second = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for method in INSTRUMENTED:
+            func = cls.__dict__.get(method)
+            if callable(func) and not getattr(func, "instrumented", False):
+                setattr(cls, method, _instrument(method, func))
 
     @abstractmethod
-    def download_historical_data(self, tickers, period="1d"):
+    def download_historical_data(self, tickers, period="1d", start=None):
         """Downloads historical data for a list of tickers.
 
         Args:
             tickers (List[str]): A list of ticker symbols to download data for.
             period (str, optional): The period to download data for. Defaults to "1d".
+            start (str, optional): Only download bars on or after this date. Takes precedence over period.
 
         Returns:
             Dict[str, pd.DataFrame]: A dictionary of DataFrames containing the historical data for each ticker.
@@ -49,6 +98,49 @@ class IDataSource(ABC):
             float: The latest price for the ticker.
         """
 
+    def get_latest_prices(self, tickers):
+        """Gets the latest prices for many tickers at once.
+
+        Sources that can fetch several symbols in one request should override this. The default asks for each ticker
+        in turn.
+
+        Args:
+            tickers (List[str]): The ticker symbols to get the latest prices for.
+
+        Returns:
+            Dict[str, float]: The latest price for each ticker. Tickers without a price are left out.
+        """
+        prices = {}
+        for ticker in tickers:
+            price = self.get_latest_price(ticker)
+            if price is not None:
+                prices[ticker] = price
+        return prices
+
+    def stream_prices(self, tickers, interval=60, stop=None):
+        """Yields price updates for the tickers until stopped.
+
+        Sources with a push feed should override this. The default polls get_latest_prices every `interval` seconds
+        and yields only the prices that changed since the last poll.
+
+        Args:
+            tickers (List[str]): The ticker symbols to watch.
+            interval (float, optional): Seconds between polls. Defaults to 60.
+            stop (threading.Event, optional): Ends the stream once set.
+
+        Yields:
+            Dict[str, float]: The tickers whose price changed, with their new price.
+        """
+        stop = stop or threading.Event()
+        last = {}
+        while not stop.is_set():
+            prices = self.get_latest_prices(tickers)
+            changed = {ticker: price for ticker, price in prices.items() if last.get(ticker) != price}
+            last.update(changed)
+            if changed:
+                yield changed
+            stop.wait(interval)
+
     @abstractmethod
     def get_securities(self):
         """Get a list of all securities available from the source.
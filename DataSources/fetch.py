@@ -0,0 +1,185 @@
+"""fetch.py - Run data source requests concurrently.
+
+The scheduler runs per-ticker requests on a shared thread pool. Every source gets its own queue, capped at the
+source's max_concurrency requests in flight and its requests_per_second budget. A failed request is put back on its
+queue after an exponential backoff delay measured on a timer, so a ticker waiting to retry does not hold a worker or
+slow down the other tickers.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from DataSources.IDataSource import backoff_delay
+
+
+class RateLimiter:
+    """A token bucket allowing `rate` calls per second, shared by every thread calling one source."""
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until another call is allowed. Returns immediately when no rate is set."""
+        if not self.rate:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Task:
+    """A single request waiting on, or running against, a source queue."""
+
+    def __init__(self, func, args, kwargs, max_retries, base_delay, jitter):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.jitter = jitter
+        self.attempt = 0
+        self.future = Future()
+
+
+def _name(source):
+    """What a source is called in metrics: a module (yfinance, say) by its name, anything else by its class."""
+    return getattr(source, "__name__", None) or type(source).__name__
+
+
+class _SourceQueue:
+    """Pending tasks and limits for one source."""
+
+    def __init__(self, name, max_concurrency, requests_per_second):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency or 1)
+        self.limiter = RateLimiter(requests_per_second)
+        self.pending = deque()
+        self.in_flight = 0
+
+
+class FetchScheduler:
+    """Runs requests against data sources concurrently, within each source's limits."""
+
+    def __init__(self, max_workers=16, max_retries=5, base_delay=1, jitter=0.1):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.jitter = jitter
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def configure(self, source, max_concurrency=None, requests_per_second=None):
+        """Set the limits for a source. Sources not configured here use their own attributes."""
+        with self._lock:
+            if source not in self._queues:
+                self._queues[source] = _SourceQueue(_name(source), max_concurrency, requests_per_second)
+            else:
+                self._queues[source].max_concurrency = max(1, max_concurrency or 1)
+                self._queues[source].limiter.rate = requests_per_second
+        self._dispatch(self._queues[source])
+
+    def _queue(self, source):
+        with self._lock:
+            if source not in self._queues:
+                self._queues[source] = _SourceQueue(_name(source), getattr(source, "max_concurrency", 1),
+                                                    getattr(source, "requests_per_second", None))
+            return self._queues[source]
+
+    def submit(self, source, func, *args, max_retries=None, base_delay=None, jitter=None, **kwargs) -> Future:
+        """Queue func(*args, **kwargs) against a source and return a Future for its result.
+
+        The future holds the last exception if every attempt failed.
+        """
+        task = _Task(func, args, kwargs,
+                     self.max_retries if max_retries is None else max_retries,
+                     self.base_delay if base_delay is None else base_delay,
+                     self.jitter if jitter is None else jitter)
+        self._enqueue(self._queue(source), task)
+        return task.future
+
+    def map(self, source, func, keys, max_retries=None, base_delay=None, jitter=None):
+        """Call func(key) for every key concurrently and wait for all of them.
+
+        Returns:
+            Dict: The result for each key. Keys whose requests failed on every attempt map to None.
+        """
+        futures = {key: self.submit(source, func, key, max_retries=max_retries, base_delay=base_delay, jitter=jitter)
+                   for key in dict.fromkeys(keys)}
+
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                metrics.increment("fetch.failures", source=_name(source))
+                print(f"Failed to fetch {key}: {e}")
+                results[key] = None
+        return results
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _enqueue(self, queue, task):
+        with self._lock:
+            queue.pending.append(task)
+        self._dispatch(queue)
+
+    def _dispatch(self, queue):
+        """Start as many pending tasks as the source allows."""
+        with self._lock:
+            ready = []
+            while queue.pending and queue.in_flight < queue.max_concurrency:
+                queue.in_flight += 1
+                ready.append(queue.pending.popleft())
+
+        for task in ready:
+            self._executor.submit(self._run, queue, task)
+
+    def _run(self, queue, task):
+        try:
+            queue.limiter.acquire()
+            metrics.increment("fetches", source=queue.name)
+            with metrics.timed("fetch.latency", source=queue.name):
+                result = task.func(*task.args, **task.kwargs)
+            task.future.set_result(result)
+        except Exception as e:
+            task.attempt += 1
+            if task.attempt < task.max_retries:
+                delay = backoff_delay(task.attempt - 1, task.base_delay, task.jitter)
+                metrics.increment("retries", source=queue.name)
+                timer = threading.Timer(delay, self._enqueue, (queue, task))
+                timer.daemon = True
+                timer.start()
+            else:
+                task.future.set_exception(e)
+        finally:
+            with self._lock:
+                queue.in_flight -= 1
+            self._dispatch(queue)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FetchScheduler:
+    """The scheduler shared by every data source in the process."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+        return _scheduler
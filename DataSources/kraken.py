@@ -1,34 +1,97 @@
 """Get financial data from Kraken API."""
 
-import ccxt
+import asyncio
+import threading
+from functools import partial
+
+import pandas as pd
 from DataSources.IDataSource import IDataSource, exponential_backoff
+from DataSources.fetch import get_scheduler
+from DataSources.store import COLUMNS, _period_start
+from registry import lazy_import
+
+ccxt = lazy_import("ccxt")
+
+
+def _frame(ohlcv) -> pd.DataFrame:
+    """ccxt's [timestamp, open, high, low, close, volume] rows as a frame of bars indexed by date."""
+    frame = pd.DataFrame(ohlcv, columns=["Date", *COLUMNS])
+    frame["Date"] = pd.to_datetime(frame["Date"], unit="ms")
+    return frame.set_index("Date")
 
 
 class Kraken(IDataSource):
     """A source for financial data from Kraken API."""
 
-    def __init__(self, key, secret):
-        self.exchange = ccxt.kraken
+    max_concurrency = 2
+    requests_per_second = 1
+
+    def __init__(self, key, secret, max_concurrency=None, requests_per_second=None):
+        self.key = key
+        self.secret = secret
+        self.exchange = ccxt.kraken({"apiKey": key, "secret": secret})
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
 
     def get_securities(self):
         """Get a list of all securities available from the source."""
         return self.exchange.symbols
 
-    def download_historical_data(self, tickers, period="1d"):
+    def download_historical_data(self, tickers, period="1d", start=None, timeframe="1d", max_retries=5, base_delay=1,
+                                 jitter=0.1):
         """Downloads historical data for a list of tickers.
 
         Args:
             tickers (List[str]): A list of ticker symbols to download data for.
-            period (str, optional): The period to download data for. Defaults to "1d".
+            period (str, optional): The yfinance style period to download data for ("5d", "1y", "max"...). Defaults
+                to "1d".
+            start (str, optional): Only download bars on or after this date. Takes precedence over period.
+            timeframe (str, optional): The ccxt timeframe of each bar. Defaults to "1d".
 
         Returns:
             Dict[str, pd.DataFrame]: A dictionary of DataFrames containing the historical data for each ticker.
         """
-        data = {}
-        for ticker in set(tickers):
-            data[ticker] = self.download_ticker_data(ticker, period)
-        return data
-
-    def download_ticker_data(self, ticker, period="1d"):
-        """Downloads historical data for a single ticker with exponential backoff."""
-        return exponential_backoff(5, 1, 0.1, self.exchange.fetch_ohlcv, ticker, period)
\ No newline at end of file
+        start = pd.Timestamp(start) if start is not None else _period_start(period)
+        since = None if start is None else int(start.timestamp() * 1000)
+        rows = get_scheduler().map(self, partial(self.exchange.fetch_ohlcv, timeframe=timeframe, since=since), tickers,
+                                   max_retries, base_delay, jitter)
+        return {ticker: _frame(ohlcv) for ticker, ohlcv in rows.items() if ohlcv is not None}
+
+    def download_ticker_data(self, ticker, period="1d", timeframe="1d"):
+        """Downloads historical data for a single ticker; see download_historical_data."""
+        return self.download_historical_data([ticker], period, timeframe=timeframe).get(ticker)
+
+    def get_latest_price(self, ticker):
+        """Gets the last traded price for a single symbol, e.g. "BTC/USD"."""
+        return self.get_latest_prices([ticker]).get(ticker)
+
+    def get_latest_prices(self, tickers, max_retries=5, base_delay=1, jitter=0.1):
+        """Gets the last traded prices of many symbols in one request."""
+        quotes = exponential_backoff(max_retries, base_delay, jitter, self.exchange.fetch_tickers, list(tickers)) or {}
+        return {symbol: quote["last"] for symbol, quote in quotes.items() if quote.get("last") is not None}
+
+    def stream_prices(self, tickers, interval=60, stop=None):
+        """Yields price updates pushed over Kraken's websocket feed (ccxt.pro), as they arrive.
+
+        Falls back to polling when the installed ccxt has no websocket support. interval only applies to polling.
+        """
+        try:
+            import ccxt.pro as ccxtpro
+        except ImportError:
+            yield from super().stream_prices(tickers, interval, stop)
+            return
+
+        stop = stop or threading.Event()
+        exchange = ccxtpro.kraken({"apiKey": self.key, "secret": self.secret})
+        loop = asyncio.new_event_loop()
+        try:
+            while not stop.is_set():
+                quotes = loop.run_until_complete(exchange.watch_tickers(list(tickers)))
+                prices = {symbol: quote["last"] for symbol, quote in quotes.items() if quote.get("last") is not None}
+                if prices:
+                    yield prices
+        finally:
+            loop.run_until_complete(exchange.close())
+            loop.close()
@@ -0,0 +1,117 @@
+"""mock.py - A deterministic, offline stand-in for a market data source.
+
+MockDataSource makes up daily OHLCV bars for any ticker: a random walk seeded from the ticker and the source's seed,
+so a ticker gets the same history on every run and every machine. Requests can be made slow (`latency` seconds each)
+and unreliable (failing at `failure_rate`). Whether a request fails is decided by hashing the request and the number
+of times it has been made before, so a run fails the same requests however its threads happen to be scheduled.
+
+It is registered as the "mock" data source, for benchmarks and for running without a network.
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from DataSources.IDataSource import IDataSource
+from DataSources.store import _period_start
+
+
+def _unit(*key):
+    """A number in [0, 1) fixed by the key."""
+    return zlib.crc32(repr(key).encode()) / 2 ** 32
+
+
+class MockDataSource(IDataSource):
+    """Made up, reproducible market data with configurable latency and failures.
+
+    Args:
+        tickers (List[str], optional): The securities the source knows. Defaults to any ticker asked for.
+        seed (int, optional): Changes every history at once.
+        latency (float, optional): Seconds each request takes.
+        failure_rate (float, optional): The fraction of requests that raise ConnectionError.
+        start, end (optional): The first and last bar dates. Default to ten years ago and today.
+        max_concurrency, requests_per_second (optional): Limits for the fetch scheduler, as on any source.
+    """
+
+    max_concurrency = 8
+    requests_per_second = None
+
+    def __init__(self, tickers=None, seed=0, latency=0.0, failure_rate=0.0, start=None, end=None,
+                 max_concurrency=None, requests_per_second=None):
+        self.universe = list(tickers) if tickers is not None else None
+        self._known = set(self.universe) if self.universe is not None else None
+        self.seed = seed
+        self.latency = latency
+        self.failure_rate = failure_rate
+        end = pd.Timestamp(end if end is not None else pd.Timestamp.now()).normalize()
+        start = pd.Timestamp(start) if start is not None else end - pd.DateOffset(years=10)
+        self.dates = pd.bdate_range(start, end, name="Date")
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
+        self.requests = 0
+        self.failures = 0
+        self._attempts = {}
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def bars(self, ticker) -> pd.DataFrame:
+        """The whole made up history of a ticker, without the cost of a request."""
+        frame = self._bars.get(ticker)
+        if frame is not None:
+            return frame
+
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        n = len(self.dates)
+        close = rng.uniform(10, 500) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+        open_ = close * np.exp(rng.normal(0, 0.005, n))
+        frame = pd.DataFrame({
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n)),
+            "Low": np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n)),
+            "Close": close,
+            "Volume": rng.integers(10_000, 10_000_000, n).astype(np.float64),
+        }, index=self.dates)
+        # Two threads making the same ticker at once make the same frame, so there is nothing to lock.
+        self._bars[ticker] = frame
+        return frame
+
+    def _request(self, method, tickers):
+        """Count a request, wait out its latency and fail it if its turn has come up."""
+        key = (method, tuple(tickers))
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and _unit(self.seed, key, attempt) < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise ConnectionError(f"Mock {method} failed for {len(tickers)} tickers (attempt {attempt + 1}).")
+
+    def _tickers(self, tickers):
+        tickers = list(dict.fromkeys(tickers))
+        return tickers if self._known is None else [ticker for ticker in tickers if ticker in self._known]
+
+    def get_securities(self):
+        return list(self.universe or [])
+
+    def download_historical_data(self, tickers, period="1d", start=None):
+        tickers = list(tickers)
+        self._request("download_historical_data", tickers)
+        first = pd.Timestamp(start) if start is not None else _period_start(period, self.dates[-1])
+        return {ticker: self.bars(ticker).loc[first:] if first is not None else self.bars(ticker)
+                for ticker in self._tickers(tickers)}
+
+    def get_latest_price(self, ticker):
+        self._request("get_latest_price", [ticker])
+        return float(self.bars(ticker)["Close"].iloc[-1]) if self._tickers([ticker]) else None
+
+    def get_latest_prices(self, tickers):
+        tickers = list(tickers)
+        self._request("get_latest_prices", tickers)
+        return {ticker: float(self.bars(ticker)["Close"].iloc[-1]) for ticker in self._tickers(tickers)}
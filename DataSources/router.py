@@ -0,0 +1,172 @@
+"""router.py - Route requests across several data sources.
+
+SourceRouter is itself an IDataSource. It asks its sources in order and hands whatever tickers one source could not
+answer to the next. Each source has a circuit breaker: a source that keeps failing is skipped for a cool down period
+instead of being waited on for every request. An empty answer to a non-empty request counts as a failure. In hedged mode
+the next source is asked as well when the current one has not answered within a latency budget, and whichever answers
+first wins.
+
+Sources that take a `max_retries` argument are asked with a single try: the router decides whether to go elsewhere,
+rather than the source sleeping through its own retries.
+"""
+import inspect
+import threading
+import time
+from concurrent.futures import Future, as_completed, wait
+from typing import Dict, List
+
+from DataSources.IDataSource import IDataSource
+
+
+class CircuitBreaker:
+    """Health of a single source.
+
+    After `threshold` consecutive failures the breaker opens and the source is skipped. Once `cooldown` seconds have
+    passed a request is let through again; a success closes the breaker and a failure opens it for another cool down.
+    Outcomes may be recorded from several hedging threads at once.
+    """
+
+    def __init__(self, threshold=3, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.latency = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether the source should be asked right now."""
+        return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self, latency):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            # Exponentially weighted so one slow answer does not dominate.
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return not self.allow()
+
+
+class SourceRouter(IDataSource):
+    """An ordered failover chain of data sources with circuit breakers and optional hedging."""
+
+    def __init__(self, sources: List[IDataSource], hedge_after=None, failure_threshold=3, cooldown=60):
+        self.sources = list(sources)
+        self.hedge_after = hedge_after
+        self.health: Dict[IDataSource, CircuitBreaker] = {source: CircuitBreaker(failure_threshold, cooldown)
+                                                          for source in self.sources}
+
+    def get_securities(self):
+        securities = set()
+        for source in self._available():
+            try:
+                securities.update(source.get_securities())
+            except NotImplementedError:
+                continue
+        return sorted(securities)
+
+    def download_historical_data(self, tickers, period="1d", start=None):
+        def request(source, remaining):
+            data = _call(source.download_historical_data, remaining, period=period, start=start)
+            return {ticker: frame for ticker, frame in data.items() if frame is not None and len(frame)}
+
+        return self._route(request, tickers)
+
+    def get_latest_price(self, ticker):
+        return self.get_latest_prices([ticker]).get(ticker)
+
+    def get_latest_prices(self, tickers):
+        return self._route(lambda source, remaining: _call(source.get_latest_prices, remaining), tickers)
+
+    def _available(self):
+        return [source for source in self.sources if self.health[source].allow()]
+
+    def _route(self, request, tickers):
+        """Walk the failover chain until every ticker has an answer or the chain runs out."""
+        remaining = list(dict.fromkeys(tickers))
+        results = {}
+        chain = self._available()
+        i = 0
+        while remaining and i < len(chain):
+            if self.hedge_after is not None and i + 1 < len(chain):
+                found, asked = self._hedged(request, chain[i], chain[i + 1], remaining)
+                i += asked
+            else:
+                found = self._attempt(request, chain[i], remaining)
+                i += 1
+            results.update(found)
+            remaining = [ticker for ticker in remaining if ticker not in found]
+
+        if remaining and self.sources:
+            print(f"No source could answer for {', '.join(remaining)}.")
+        return results
+
+    def _attempt(self, request, source, tickers):
+        """Ask one source, recording the outcome on its breaker. Failures come back as an empty answer."""
+        started = time.monotonic()
+        try:
+            found = request(source, tickers)
+        except Exception as e:
+            self.health[source].record_failure()
+            print(f"{type(source).__name__} failed: {e}")
+            return {}
+
+        found = {ticker: value for ticker, value in (found or {}).items() if value is not None}
+        if tickers and not found:
+            # Sources that give up quietly answer with nothing; that is a failure all the same.
+            self.health[source].record_failure()
+            return {}
+
+        self.health[source].record_success(time.monotonic() - started)
+        return found
+
+    def _hedged(self, request, primary, backup, tickers):
+        """Ask primary, and backup too if primary has not answered within hedge_after seconds.
+
+        Returns:
+            The answers, and how many of the two sources were asked. When primary answers in time, backup is left to
+            the next step of the chain, which asks it for whatever primary could not answer.
+        """
+        first = _spawn(self._attempt, request, primary, tickers)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result(), 1
+
+        found = {}
+        for future in as_completed([first, _spawn(self._attempt, request, backup, tickers)]):
+            for ticker, value in future.result().items():
+                found.setdefault(ticker, value)
+            if all(ticker in found for ticker in tickers):
+                # The slower source keeps running in the background and still reports to its breaker.
+                break
+        return found, 2
+
+
+def _spawn(func, *args) -> Future:
+    """Run func on a daemon thread, so a source that never answers cannot hold up the interpreter's exit."""
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="hedge", daemon=True).start()
+    return future
+
+
+def _call(method, *args, **kwargs):
+    """Call a source method, with a single try if it retries by itself."""
+    if "max_retries" in inspect.signature(method).parameters:
+        kwargs["max_retries"] = 1
+    return method(*args, **kwargs)
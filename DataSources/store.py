@@ -0,0 +1,259 @@
+"""store.py - A local OHLCV bar store and a data source that refreshes it incrementally.
+
+Bars are kept in SQLite, keyed by (source, ticker, interval, date). CachedDataSource wraps any IDataSource and serves
+history out of the store. It only asks the wrapped source for bars newer than the last one stored, so after the first
+run a refresh costs about one bar per ticker.
+"""
+import sqlite3
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+import metrics
+from DataSources.IDataSource import IDataSource
+
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _period_start(period, now=None):
+    """The first date covered by a yfinance style period ("5d", "1mo", "1y", "ytd", "max"), or None for "max"."""
+    now = (now or pd.Timestamp.now()).normalize()
+    period = period.lower()
+    if period == "max":
+        return None
+    if period == "ytd":
+        return now.replace(month=1, day=1)
+    if period.endswith("mo"):
+        return now - pd.DateOffset(months=int(period[:-2]))
+    if period.endswith("wk"):
+        return now - pd.DateOffset(weeks=int(period[:-2]))
+    if period.endswith("y"):
+        return now - pd.DateOffset(years=int(period[:-1]))
+    if period.endswith("d"):
+        return now - pd.DateOffset(days=int(period[:-1]))
+    raise ValueError(f"Unknown period {period}")
+
+
+def _date_key(date, interval):
+    """Render a bar timestamp as a sortable text key."""
+    date = pd.Timestamp(date)
+    if date.tzinfo is not None:
+        date = date.tz_localize(None)
+    if interval.endswith(("d", "wk", "mo")):
+        return date.strftime("%Y-%m-%d")
+    return date.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _ohlcv(frame):
+    """Flatten a single ticker download to plain Open/High/Low/Close/Volume columns."""
+    if isinstance(frame.columns, pd.MultiIndex):
+        level = next(i for i in range(frame.columns.nlevels) if "Close" in frame.columns.get_level_values(i))
+        frame = frame.droplevel([i for i in range(frame.columns.nlevels) if i != level], axis=1)
+    return frame.reindex(columns=COLUMNS).dropna(how="all")
+
+
+class BarStore:
+    """OHLCV bars in a SQLite file, keyed by (source, ticker, interval, date)."""
+
+    def __init__(self, path=".bars.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS bars (
+                source TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                date TEXT NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, volume REAL,
+                PRIMARY KEY (source, ticker, interval, date)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS coverage (
+                source TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                start TEXT NOT NULL,
+                fetched_at TEXT NOT NULL,
+                PRIMARY KEY (source, ticker, interval)
+            ) WITHOUT ROWID;
+        """)
+
+    def save(self, source, ticker, interval, frame):
+        """Insert or replace the bars in a DataFrame indexed by date."""
+        frame = _ohlcv(frame)
+        rows = [(source, ticker, interval, _date_key(date, interval), *values)
+                for date, values in zip(frame.index, frame.itertuples(index=False, name=None))]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def load(self, source, ticker, interval, start=None):
+        """Load stored bars for a ticker, optionally from a start date on, as a DataFrame indexed by Date."""
+        query = "SELECT date, open, high, low, close, volume FROM bars WHERE source = ? AND ticker = ? AND interval = ?"
+        params = [source, ticker, interval]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(_date_key(start, interval))
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY date", params).fetchall()
+
+        frame = pd.DataFrame(rows, columns=["Date"] + COLUMNS)
+        frame["Date"] = pd.to_datetime(frame["Date"])
+        return frame.set_index("Date")
+
+    def load_panel(self, source, tickers, interval, start=None, field="Close"):
+        """Load one field of the stored bars of many tickers as a DataFrame indexed by Date, one column per ticker."""
+        if field not in COLUMNS:
+            raise ValueError(f"Unknown field {field}, expected one of {', '.join(COLUMNS)}")
+        tickers = list(tickers)
+        query = (f"SELECT date, ticker, {field.lower()} FROM bars WHERE source = ? AND interval = ? "
+                 "AND ticker IN ({})")
+        params = []
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(_date_key(start, interval))
+
+        rows = []
+        # Stay under SQLite's limit on bound parameters.
+        for i in range(0, len(tickers), 500):
+            chunk = tickers[i:i + 500]
+            with self._lock:
+                rows += self._connection.execute(query.format(", ".join("?" * len(chunk))),
+                                                 [source, interval, *chunk, *params]).fetchall()
+
+        frame = pd.DataFrame(rows, columns=["Date", "Ticker", field])
+        frame["Date"] = pd.to_datetime(frame["Date"])
+        panel = frame.pivot(index="Date", columns="Ticker", values=field).sort_index()
+        return panel.reindex(columns=tickers)
+
+    def last_dates(self, source, tickers, interval):
+        """The date of the newest stored bar for each ticker that has any."""
+        return self._lookup("SELECT ticker, MAX(date) FROM bars WHERE source = ? AND interval = ? AND ticker IN ({}) "
+                            "GROUP BY ticker", source, tickers, interval)
+
+    def last_closes(self, source, tickers, interval):
+        """The close of the newest stored bar for each ticker that has any."""
+        # SQLite takes bare columns from the row that supplied MAX().
+        return {ticker: close for ticker, (close, _) in
+                self._lookup("SELECT ticker, close, MAX(date) FROM bars WHERE source = ? AND interval = ? "
+                             "AND close IS NOT NULL AND ticker IN ({}) GROUP BY ticker", source, tickers,
+                             interval).items()}
+
+    def coverage(self, source, tickers, interval):
+        """The (start, fetched_at) a ticker's history was last downloaded with, for each ticker downloaded before."""
+        return {ticker: (start, pd.Timestamp(fetched_at)) for ticker, (start, fetched_at) in
+                self._lookup("SELECT ticker, start, fetched_at FROM coverage WHERE source = ? AND interval = ? "
+                             "AND ticker IN ({})", source, tickers, interval).items()}
+
+    def set_coverage(self, source, ticker, interval, start, fetched_at):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)",
+                                     (source, ticker, interval, start, fetched_at.isoformat()))
+
+    def _lookup(self, query, source, tickers, interval):
+        tickers = list(tickers)
+        results = {}
+        # Stay under SQLite's limit on bound parameters.
+        for i in range(0, len(tickers), 500):
+            chunk = tickers[i:i + 500]
+            with self._lock:
+                rows = self._connection.execute(query.format(", ".join("?" * len(chunk))),
+                                                [source, interval, *chunk]).fetchall()
+            for ticker, *values in rows:
+                results[ticker] = values[0] if len(values) == 1 else tuple(values)
+        return results
+
+    def close(self):
+        self._connection.close()
+
+
+class CachedDataSource(IDataSource):
+    """Serves market data out of a BarStore, downloading only bars newer than the last stored one.
+
+    A ticker refreshed less than max_age ago is served straight from the store without touching the network.
+    """
+
+    def __init__(self, source: IDataSource, store: BarStore = None, interval="1d", max_age=pd.Timedelta(minutes=15)):
+        self.source = source
+        self.store = store or BarStore()
+        self.interval = interval
+        self.max_age = max_age
+        self.name = type(source).__name__.lower()
+        self.max_concurrency = source.max_concurrency
+        self.requests_per_second = source.requests_per_second
+
+    def get_securities(self):
+        return self.source.get_securities()
+
+    def download_historical_data(self, tickers, period="1d", start=None):
+        """Downloads historical data for a list of tickers, refreshing the store first.
+
+        Returns:
+            Dict[str, pd.DataFrame]: The stored bars covering the period (or from start on) for each ticker.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        self.refresh(tickers, period)
+        if start is None:
+            start = _period_start(period)
+        return {ticker: self.store.load(self.name, ticker, self.interval, start) for ticker in tickers}
+
+    def download_ticker_data(self, ticker, period="1d"):
+        return self.download_historical_data([ticker], period)[ticker]
+
+    def get_latest_price(self, ticker):
+        return self.get_latest_prices([ticker]).get(ticker)
+
+    def get_latest_prices(self, tickers):
+        tickers = list(dict.fromkeys(tickers))
+        self.refresh(tickers, period="5d")
+        return self.store.last_closes(self.name, tickers, self.interval)
+
+    def refresh(self, tickers, period="1d"):
+        """Bring the store up to date for the tickers over the period.
+
+        Tickers never downloaded, or downloaded over a shorter period, get their full history in one batch. The
+        rest are downloaded from their last stored bar on, batched by that date. The last bar is fetched again since
+        it may have been stored mid-session.
+        """
+        now = pd.Timestamp.now()
+        start = _period_start(period, now)
+        start_key = "" if start is None else _date_key(start, self.interval)
+        coverage = self.store.coverage(self.name, tickers, self.interval)
+        last_dates = self.store.last_dates(self.name, tickers, self.interval)
+
+        full = []
+        deltas = defaultdict(list)
+        for ticker in tickers:
+            if ticker not in coverage or ticker not in last_dates or start_key < coverage[ticker][0]:
+                full.append(ticker)
+            elif now - coverage[ticker][1] >= self.max_age:
+                deltas[last_dates[ticker]].append(ticker)
+
+        # Misses are downloaded in full, stale tickers from their last bar, and hits not at all.
+        stale = sum(len(group) for group in deltas.values())
+        metrics.increment("cache.misses", len(full), source=self.name)
+        metrics.increment("cache.stale", stale, source=self.name)
+        metrics.increment("cache.hits", len(tickers) - len(full) - stale, source=self.name)
+
+        if full:
+            fetched = self.source.download_historical_data(full, period=period)
+            for ticker in full:
+                if self._save(ticker, fetched.get(ticker)):
+                    self.store.set_coverage(self.name, ticker, self.interval, start_key, now)
+
+        for last_date, group in deltas.items():
+            fetched = self.source.download_historical_data(group, period=period, start=last_date)
+            for ticker in group:
+                frame = (fetched or {}).get(ticker)
+                if frame is None:
+                    continue  # the fetch failed; stay stale so the next refresh tries again
+                # No new bars (a weekend, say) still counts as fresh.
+                self._save(ticker, frame)
+                self.store.set_coverage(self.name, ticker, self.interval, coverage[ticker][0], now)
+
+    def _save(self, ticker, frame):
+        if frame is None or len(frame) == 0:
+            return False
+        self.store.save(self.name, ticker, self.interval, frame)
+        return True
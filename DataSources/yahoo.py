@@ -2,27 +2,85 @@
 import time
 from random import random
 
-import yfinance as yf
+import pandas as pd
 from abc import ABC, abstractmethod
+from functools import partial
+
 from DataSources.IDataSource import IDataSource, exponential_backoff
+from DataSources.fetch import get_scheduler
+from registry import lazy_import
+
+# yfinance is slow to import; it is loaded on the first download instead.
+yf = lazy_import("yfinance")
+
+
+def _split_tickers(data, tickers):
+    """Split a multi-symbol yf.download result (grouped by ticker) into one DataFrame per ticker."""
+    frames = {}
+    if data is None or data.empty:
+        return frames
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        # Older yfinance releases return flat columns when only one symbol was asked for.
+        frames[tickers[0]] = data
+        return frames
+
+    for ticker in data.columns.get_level_values(0).unique():
+        frame = data[ticker].dropna(how='all')
+        if not frame.empty:
+            frames[ticker] = frame
+    return frames
+
+
+def _closes(data, tickers):
+    """Pull a frame of closing prices, one column per ticker, out of a yf.download result."""
+    if data is None or data.empty:
+        return pd.DataFrame()
+
+    if not isinstance(data.columns, pd.MultiIndex):
+        return data[['Close']].rename(columns={'Close': tickers[0]})
+
+    return data['Close']
 
 
 class Yahoo(IDataSource):
     """A source for financial data from Yahoo Finance."""
 
-    def __init__(self):
-        pass
+    max_concurrency = 4
+    requests_per_second = 2
+
+    def __init__(self, max_concurrency=None, requests_per_second=None):
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        if requests_per_second is not None:
+            self.requests_per_second = requests_per_second
 
     def get_securities(self):
         """Get a list of all securities available from the source."""
         # TODO https://quant.stackexchange.com/q/1640
         raise NotImplementedError
 
-    def download_historical_data(self, tickers, period="1d", max_retries=5, base_delay=1, jitter=0.1):
-        """Downloads historical data for a list of tickers with exponential backoff."""
-        data = {}
-        for ticker in set(tickers):
-            data[ticker] = self.download_ticker_data(ticker, period, max_retries, base_delay, jitter)
+    def download_historical_data(self, tickers, period="1d", start=None, max_retries=5, base_delay=1, jitter=0.1):
+        """Downloads historical data for a list of tickers with exponential backoff.
+
+        All tickers are requested in a single batched download. Tickers missing from the batch are then fetched one
+        at a time, concurrently, through the fetch scheduler.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return {}
+
+        # yfinance only honours start when no period is given.
+        if start is not None:
+            period = None
+
+        batch = exponential_backoff(max_retries, base_delay, jitter, yf.download, tickers, period=period, start=start,
+                                    auto_adjust=True, group_by="ticker", progress=False)
+        data = _split_tickers(batch, tickers)
+
+        missing = [ticker for ticker in tickers if ticker not in data]
+        download = partial(yf.download, period=period, start=start, auto_adjust=True, progress=False)
+        data.update(get_scheduler().map(self, download, missing, max_retries, base_delay, jitter))
         return data
 
     def download_ticker_data(self, ticker, period="1d", max_retries=5, base_delay=1, jitter=0.1):
@@ -34,5 +92,32 @@ class Yahoo(IDataSource):
         # return yf.Ticker(ticker).history(period="1d")["Close"].iloc[-1]
         return exponential_backoff(5, 1, 0.1, self._get_latest_price, ticker)
 
+    def get_latest_prices(self, tickers, max_retries=5, base_delay=1, jitter=0.1):
+        """Gets the latest prices for many tickers with one batched download.
+
+        A few days of closes are requested so that symbols which did not trade today still have a price. Tickers
+        missing from the batch are looked up one at a time, concurrently, through the fetch scheduler.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return {}
+
+        batch = exponential_backoff(max_retries, base_delay, jitter, yf.download, tickers, period="5d",
+                                    auto_adjust=True, progress=False)
+        closes = _closes(batch, tickers)
+
+        prices = {}
+        if not closes.empty:
+            for ticker, price in closes.ffill().iloc[-1].items():
+                if ticker in tickers and pd.notna(price):
+                    prices[ticker] = float(price)
+
+        missing = [ticker for ticker in tickers if ticker not in prices]
+        for ticker, price in get_scheduler().map(self, self._get_latest_price, missing,
+                                                 max_retries, base_delay, jitter).items():
+            if price is not None:
+                prices[ticker] = price
+        return prices
+
     def _get_latest_price(self, ticker):
         return yf.Ticker(ticker).history(period="1d")["Close"].iloc[-1]
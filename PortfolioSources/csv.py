@@ -1,80 +1,173 @@
+import os
 from typing import List, ContextManager, Dict, Iterable
 import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+import metrics
 from PortfolioSources.IPortfolioSource import IPortfolioSource
 from position import Position
 from transaction import Transaction
+from transaction_store import AggregateStore, TransactionStore
+
+DOLLAR_COLUMNS = ['Price', 'Cost Basis', 'Trailing Stop']
+
+
+def _parse_numbers(column: pd.Series, fill=None) -> pd.Series:
+    """Parse a column of numbers that may carry '$' signs and thousands separators, all at once.
+
+    Cells that do not parse become `fill` (NaN by default).
+    """
+    if pd.api.types.is_numeric_dtype(column):
+        parsed = column
+    else:
+        text = column.astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False)
+        parsed = pd.to_numeric(text, errors='coerce')
+    return parsed if fill is None else parsed.fillna(fill)
 
 
 class CsvPortfolioSource(IPortfolioSource, ContextManager):
-    """Portfolio data from a CSV file."""
+    """Portfolio data from a CSV file.
+
+    The file is parsed column-wise: currency columns and dates are converted in one vectorized pass each, and positions
+    are built per ticker from a single groupby. Pass engine="pyarrow" to parse with the multithreaded pyarrow reader.
 
-    def __init__(self, file_path, versioning=True, versioning_template="{file_path}.{timestamp}"):
+    With a chunksize the file is streamed instead: each chunk of rows is folded into per-ticker totals (an
+    AggregateStore) and dropped, so memory stays bounded however long the history is. No Position objects are built in
+    that mode; the store alone is enough for Portfolio's metrics.
+
+    On exit only what changed is written. Nothing is written if no position changed. If transactions were only
+    appended, just the new rows are appended to the file. When versioning is on, the file itself is left alone: a
+    rewrite goes to a new full version (`versioning_template`), while appended rows alone go to a delta file
+    (`delta_template`, ending in ".delta" by default). A delta is a CSV of the same columns, so the version it makes is
+    the file followed by the delta's rows. Written dates keep the format the file was read in.
+    """
+
+    def __init__(self, file_path, versioning=True, versioning_template="{file_path}.{timestamp}", engine=None,
+                 date_format=None, chunksize=None, delta_template="{file_path}.{timestamp}.delta"):
         self.file_path = file_path
         self.positions: Dict[str, Position] = {}
+        self.store: TransactionStore | AggregateStore = None
         self._positions: pd.DataFrame = None
-        self._old_positions: pd.DataFrame = None
+        self._columns: List[str] = None
+        self._date_format: str = date_format
+        self._rewrite = False
         self.versioning: bool = versioning
         self.versioning_template: str = versioning_template
+        self.delta_template: str = delta_template
+        self.engine = engine
+        self.date_format = date_format
+        self.chunksize = chunksize
 
     def __enter__(self):
-        print(f"Opening {self.file_path}...")
-        self._positions = pd.read_csv(self.file_path,
-                                      thousands=',',
-                                      converters={'Price': __parse_dollar_amount,
-                                                  'Cost Basis': __parse_dollar_amount,
-                                                  'Trailing Stop': __parse_dollar_amount})
-        self._old_positions = self._positions.copy()
+        with metrics.timed("portfolio_source.read", source="csv"):
+            self._read()
+        metrics.increment("portfolio_source.rows", len(self.store), source="csv")
+        return self
+
+    def _read(self):
+        if self.chunksize:
+            self.store = AggregateStore()
+            for chunk in self._read_csv(chunksize=self.chunksize):
+                self._columns = self._columns or list(chunk.columns)
+                self.store.fold(self._parse(chunk))
+            return
+
+        self._positions = self._parse(self._read_csv())
+        self._columns = list(self._positions.columns)
 
         self.positions = self._read_positions()
 
-        return self
+    def _read_csv(self, **kwargs):
+        # The pyarrow engine has no thousands option; separators are stripped while parsing instead.
+        options = {} if self.engine == 'pyarrow' else {'thousands': ','}
+        return pd.read_csv(self.file_path, engine=self.engine, **options, **kwargs)
+
+    def _parse(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Convert the currency, quantity and date columns of freshly read rows."""
+        for column in DOLLAR_COLUMNS:
+            if column in frame:
+                frame[column] = _parse_numbers(frame[column], fill=0)
+        frame['Quantity'] = _parse_numbers(frame['Quantity'])
+        if self._date_format is None and len(frame):
+            self._date_format = guess_datetime_format(str(frame['Date'].iloc[0]))
+        frame['Date'] = pd.to_datetime(frame['Date'], format=self._date_format)
+        return frame
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._positions = self._write_positions()
-
-        # If there are no changes, don't write the file.
-        if len(self._positions) == len(self._old_positions):
-            if self._positions.equals(self._old_positions):
+        # A streamed file was never held in memory, so only appended positions can be written back.
+        if self._rewrite or any(position.dirty for position in self.positions.values()):
+            if self.chunksize:
+                raise NotImplementedError("Cannot rewrite a streamed portfolio file.")
+            self._write_file(self._write_positions())
+        else:
+            new_rows = self._rows(transaction for position in self.positions.values()
+                                  for transaction in position.new_transactions())
+            # If there are no changes, don't write the file.
+            if new_rows.empty:
                 return
+            self._append_file(new_rows)
 
-        # Handle versioning
-        if self.versioning:
-            timestamp = pd.Timestamp.now().strftime("%Y%m%d%H%M%S")
-            new_file_path = self.versioning_template.format(file_path=self.file_path, timestamp=timestamp)
-            self._positions.to_csv(new_file_path, index=False)
-        else:
-            self._positions.to_csv(self.file_path, index=False)
+        for position in self.positions.values():
+            position.mark_persisted()
+        self._rewrite = False
+
+    def _versioned_path(self, template=None):
+        timestamp = pd.Timestamp.now().strftime("%Y%m%d%H%M%S")
+        return (template or self.versioning_template).format(file_path=self.file_path, timestamp=timestamp)
+
+    def _write_file(self, frame: pd.DataFrame):
+        """Write the whole portfolio, to a new version of the file when versioning."""
+        frame.to_csv(self._versioned_path() if self.versioning else self.file_path, index=False)
 
-    def __parse_dollar_amount(self, s: str):
-        try:
-            return float(s.replace('$', '').replace(',', ''))
-        except ValueError:
-            return 0
+    def _append_file(self, rows: pd.DataFrame):
+        """Append rows onto the end of the file, or write them alone to a delta file when versioning."""
+        rows = rows.reindex(columns=self._columns)
+        if self.versioning:
+            rows.to_csv(self._versioned_path(self.delta_template), index=False)
+            return
+
+        with open(self.file_path, 'rb+') as file:
+            # Make sure the new rows start on their own line.
+            file.seek(0, os.SEEK_END)
+            if file.tell():
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    file.write(b'\n')
+        rows.to_csv(self.file_path, mode='a', header=False, index=False)
 
     def _read_positions(self) -> Dict[str, Position]:
-        """Read positions in from the underlying dataframe."""
-        for index, row in self._positions.iterrows():
-            # print(row)
-            ticker = row['Ticker']
-            if ticker not in self.positions:
-                # print(f"Creating position for {ticker}, {row['Date']}, {row['Action']}, {row['Price']}, {row['Quantity']}")
-                position = Position(ticker)
-                position.add_transaction(Transaction(row['Ticker'], pd.to_datetime(row["Date"]), row["Price"], row["Quantity"]))
-                self.positions[ticker] = position
+        """Read positions in from the underlying dataframe, one groupby over tickers rather than row by row."""
+        frame = self._positions
+        self.store = TransactionStore.from_frame(frame)
+
+        dates = list(frame['Date'])
+        prices = frame['Price'].tolist()
+        quantities = frame['Quantity'].tolist()
+        for ticker, rows in frame.groupby('Ticker', sort=False).indices.items():
+            position = Position(ticker, [Transaction(ticker, dates[i], prices[i], quantities[i]) for i in rows])
+            if ticker in self.positions:
+                self.positions[ticker].merge_position(position)
             else:
-                # print(f"Adding transaction to position for {ticker}, {row['Date']}, {row['Action']}, {row['Price']}, {row['Quantity']}")
-                self.positions[ticker].add_transaction(Transaction(row['Ticker'], pd.to_datetime(row["Date"]), row["Price"], row["Quantity"]))
+                self.positions[ticker] = position
+
+        for position in self.positions.values():
+            position.mark_persisted()
 
         return self.positions
 
     def _write_positions(self) -> pd.DataFrame:
         """Write position objects into the underlying dataframe."""
-        data = []
-        for ticker, position in self.positions.items():
-            for transaction in position.transactions:
-                data.append([position.ticker, transaction.date, transaction.price, transaction.quantity])
-
-        return pd.DataFrame(data, columns=["Ticker", "Date", "Price", "Quantity"])
+        return self._rows(transaction for position in self.positions.values() for transaction in position.transactions)
+
+    def _rows(self, transactions: Iterable[Transaction]) -> pd.DataFrame:
+        """Transactions as file rows, dated in the file's own format."""
+        frame = pd.DataFrame([[transaction.ticker, transaction.date, transaction.action.name.title(),
+                               transaction.quantity, transaction.price, transaction.amount]
+                              for transaction in transactions],
+                             columns=["Ticker", "Date", "Action", "Quantity", "Price", "Cost Basis"])
+        if self._date_format and not frame.empty:
+            frame['Date'] = pd.to_datetime(frame['Date']).dt.strftime(self._date_format)
+        return frame
 
     def get_position(self, ticker) -> Position:
         if ticker in self.positions:
@@ -88,6 +181,8 @@ class CsvPortfolioSource(IPortfolioSource, ContextManager):
         if position.ticker in self.positions:
             self.positions[position.ticker].merge_position(position)
         else:
+            # Whatever another source saved of it, none of it is in this file yet.
+            position.persisted = 0
             self.positions[position.ticker] = position
 
     def modify_position(self, position):
@@ -97,4 +192,5 @@ class CsvPortfolioSource(IPortfolioSource, ContextManager):
             self.add_position(position)
 
     def delete_position(self, position):
-        self.positions.pop(position.ticker)
\ No newline at end of file
+        self.positions.pop(position.ticker)
+        self._rewrite = True
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""Portfolio data from a ledger-cli journal.
+
+The journal is read in a single streaming pass, one line at a time, and each entry is turned into transactions as soon
+as it is complete. Nothing but the positions being built is kept in memory, so the cost grows with the number of
+entries and not with the size of the file.
+
+Supported syntax: dated entries (`2029-01-25 * (code) Payee`, with `-`, `/` or `.` separators and an optional
+`=aux` date), postings with prefix or suffix commodities, per-unit `@` and total `@@` prices, `{lot}` prices, balance
+assertions, inline and whole-line comments, and a single elided amount per entry. Directives and periodic or
+automated entries are skipped.
+"""
+import re
+from collections import Counter, defaultdict, namedtuple
+from typing import ContextManager, Dict, Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from PortfolioSources.IPortfolioSource import IPortfolioSource
+from position import Position
+from transaction import Transaction
+from transaction_store import TransactionStore
+
+Posting = namedtuple("Posting", "account quantity commodity price")
+Entry = namedtuple("Entry", "date payee postings")
+
+DATE_RE = re.compile(r'(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:=\S+)?\s*(?:[*!]\s*)?(?:\([^)]*\)\s*)?(.*)')
+ACCOUNT_RE = re.compile(r'\s+(?:[*!]\s*)?(.+?)(?:(?:\t|  )\s*(.*))?$')
+AMOUNT_RE = re.compile(r'''
+    (?P<neg>-)?\s*
+    (?:(?P<prefix>"[^"]+"|[^\s\d.,@{}=;"+-]+)\s*)?
+    (?P<neg2>-)?
+    (?P<number>\d[\d,]*(?:\.\d*)?|\.\d+)
+    (?:\s*(?P<suffix>"[^"]+"|[^\s\d.,@{}=;"()+-][^\s@{}=;"]*))?
+''', re.VERBOSE)
+
+
+def _amount(text):
+    """Parse an amount such as `$-1,000.00`, `-100 AAPL` or `"ABC 1" 5` into (quantity, commodity, rest of text)."""
+    match = AMOUNT_RE.match(text)
+    if not match:
+        return None, None, text
+    quantity = float(match["number"].replace(",", ""))
+    if match["neg"] or match["neg2"]:
+        quantity = -quantity
+    commodity = (match["prefix"] or match["suffix"] or "").strip('"')
+    return quantity, commodity, text[match.end():].lstrip()
+
+
+def _posting(account, text):
+    """Parse the amount part of a posting, with any lot price, `@`/`@@` price and balance assertion."""
+    text = text.split(";", 1)[0].strip()
+    if not text or text.startswith("="):
+        return Posting(account, None, None, None)
+
+    quantity, commodity, rest = _amount(text)
+    price = None
+    if rest.startswith("{"):
+        # A lot price, e.g. `10 AAPL {$50}`, is the cost per unit.
+        lot, _, rest = rest[1:].partition("}")
+        price, _, _ = _amount(lot.strip().lstrip("="))
+        rest = rest.lstrip()
+        if rest.startswith("["):
+            rest = rest.partition("]")[2].lstrip()
+    if rest.startswith("@@"):
+        total, _, _ = _amount(rest[2:].lstrip())
+        price = abs(total / quantity) if total is not None and quantity else None
+    elif rest.startswith("@"):
+        price, _, _ = _amount(rest[1:].lstrip())
+    return Posting(account, quantity, commodity, price)
+
+
+def _number(value) -> str:
+    """A number written out in full, with as many digits as it takes to read back the same float."""
+    return np.format_float_positional(float(value), trim="-")
+
+
+def parse_ledger(lines: Iterable[str]) -> Iterator[Entry]:
+    """Yield each entry of a ledger journal as soon as it has been read."""
+    dates = {}
+    date = payee = None
+    postings: List[Posting] = []
+
+    for line in lines:
+        first = line[:1]
+        if first in (" ", "\t"):
+            if date is None:
+                continue  # belongs to a directive or a skipped entry
+            body = line.split(";", 1)[0]
+            if not body.strip():
+                continue
+            match = ACCOUNT_RE.match(body)
+            if match:
+                postings.append(_posting(match[1].strip(), match[2] or ""))
+            continue
+
+        if date is not None:
+            yield Entry(date, payee, postings)
+            date = payee = None
+            postings = []
+
+        if first.isdigit():
+            match = DATE_RE.match(line)
+            if match:
+                key = match.group(1, 2, 3)
+                if key not in dates:
+                    dates[key] = pd.Timestamp(int(key[0]), int(key[1]), int(key[2]))
+                date = dates[key]
+                payee = match[4].split(";", 1)[0].strip()
+
+    if date is not None:
+        yield Entry(date, payee, postings)
+
+
+class LedgerPortfolioSource(IPortfolioSource, ContextManager):
+    """Portfolio data from a ledger-cli journal.
+
+    Postings in any commodity other than the cash `currencies` become transactions for that commodity's position;
+    amounts with no commodity at all count as cash. The price comes from the posting's `@`, `@@` or `{lot}` price.
+    Without one, the price is implied by the cash legs of the entry, as in `100 AAPL` balanced by `$-1000`.
+
+    On exit, positions and transactions added since the file was read are appended as new entries, with quantities
+    and prices written at full precision. Deleting or replacing positions is kept in memory only, since the journal
+    cannot be regenerated faithfully: transactions of a replaced position that are already in the journal are not
+    written again.
+    """
+
+    def __init__(self, file_path, currencies=("$", "USD"), stock_account="Assets:Investments:Stocks:{ticker}",
+                 cash_account="Assets:Investments:Cash"):
+        self.file_path = file_path
+        self.currencies = set(currencies)
+        self.stock_account = stock_account
+        self.cash_account = cash_account
+        self.positions: Dict[str, Position] = {}
+        self.store: TransactionStore = None
+        self.entries = 0
+        # Saved transactions of deleted or replaced positions, by ticker, so adding them back does not duplicate them.
+        self._removed: Dict[str, Counter] = defaultdict(Counter)
+
+    def __enter__(self):
+        with metrics.timed("portfolio_source.read", source="ledger"):
+            self._read()
+        metrics.increment("portfolio_source.rows", len(self.store), source="ledger")
+        return self
+
+    def _read(self):
+        transactions = defaultdict(list)
+        with open(self.file_path, encoding="utf-8") as file:
+            for entry in parse_ledger(file):
+                self.entries += 1
+                for transaction in self._transactions(entry):
+                    transactions[transaction.ticker].append(transaction)
+
+        for ticker, ticker_transactions in transactions.items():
+            self.positions[ticker] = Position(ticker, ticker_transactions)
+            self.positions[ticker].mark_persisted()
+        self.store = TransactionStore.from_positions(self.positions)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        lines = []
+        for position in self.positions.values():
+            removed = self._removed.get(position.ticker)
+            for transaction in position.new_transactions():
+                if removed and removed[transaction]:
+                    removed[transaction] -= 1
+                    continue
+                lines.append(self._entry_text(transaction))
+            position.mark_persisted()
+        self._removed.clear()
+
+        if lines:
+            with open(self.file_path, "a", encoding="utf-8") as file:
+                file.write("\n" + "\n".join(lines))
+
+    def _transactions(self, entry: Entry) -> List[Transaction]:
+        """Turn the commodity postings of an entry into transactions."""
+        amounts = [posting for posting in entry.postings if posting.quantity is not None]
+        commodities = [posting for posting in amounts if not self._cash(posting)]
+        if not commodities:
+            return []
+
+        # Cash legs, including one elided posting that balances whatever else is in the entry.
+        cash = sum(posting.quantity for posting in amounts if self._cash(posting))
+        if not cash and any(posting.quantity is None for posting in entry.postings):
+            cash = -sum(posting.quantity * posting.price for posting in commodities if posting.price is not None)
+
+        transactions = []
+        for posting in commodities:
+            price = posting.price
+            if price is None and len(commodities) == 1 and posting.quantity:
+                price = abs(cash / posting.quantity)
+            if price is None:
+                continue
+            transactions.append(Transaction(posting.commodity, entry.date, price, posting.quantity))
+        return transactions
+
+    def _cash(self, posting: Posting) -> bool:
+        return not posting.commodity or posting.commodity in self.currencies
+
+    def _entry_text(self, transaction: Transaction) -> str:
+        action = "Buy" if transaction.quantity > 0 else "Sell"
+        account = self.stock_account.format(ticker=transaction.ticker)
+        return (f"{transaction.date:%Y-%m-%d} * {action} {transaction.ticker}\n"
+                f"    {account}  {_number(transaction.quantity)} {transaction.ticker} @ ${_number(transaction.price)}\n"
+                f"    {self.cash_account}\n")
+
+    def get_position(self, ticker) -> Position:
+        if ticker in self.positions:
+            return self.positions[ticker]
+
+    def get_positions(self) -> Iterable[Position]:
+        for ticker, position in self.positions.items():
+            yield position
+
+    def add_position(self, position):
+        if position.ticker in self.positions:
+            self.positions[position.ticker].merge_position(position)
+        else:
+            # Whatever another source saved of it, only what _removed remembers is already in this journal.
+            position.persisted = 0
+            self.positions[position.ticker] = position
+
+    def modify_position(self, position):
+        old_position = self.get_position(position.ticker)
+        if old_position:
+            self.delete_position(old_position)
+            self.add_position(position)
+
+    def delete_position(self, position):
+        removed = self.positions.pop(position.ticker)
+        self._removed[removed.ticker].update(removed.transactions[:removed.persisted])
@@ -0,0 +1,72 @@
+"""snapshot.py - A binary snapshot cache of parsed portfolios.
+
+Parsing a large book is the slowest part of startup. Once a source has been parsed, its TransactionStore columns are
+saved as .npy files next to a small JSON header recording the source file's path, size and modification time (and
+optionally a content hash). On later runs, if the source file is unchanged, the columns are memory-mapped straight
+back in and the source is not parsed at all.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from transaction_store import TransactionStore
+
+COLUMNS = ["codes", "dates", "prices", "quantities"]
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    """Snapshots of parsed portfolio files, keyed by source path plus size and mtime, or content hash."""
+
+    def __init__(self, directory=".snapshots", verify_hash=False):
+        self.directory = Path(directory)
+        self.verify_hash = verify_hash
+
+    def _path(self, source_path):
+        name = hashlib.sha1(str(Path(source_path).resolve()).encode()).hexdigest()
+        return self.directory / name
+
+    def _key(self, source_path):
+        stat = os.stat(source_path)
+        key = {"path": str(Path(source_path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if self.verify_hash:
+            key["sha256"] = _file_hash(source_path)
+        return key
+
+    def load(self, source_path) -> TransactionStore:
+        """The snapshot of an unchanged source file, memory-mapped, or None."""
+        snapshot = self._path(source_path)
+        try:
+            with open(snapshot / "meta.json", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        key = self._key(source_path)
+        if meta.get("key") != key:
+            return None
+
+        columns = {column: np.load(snapshot / f"{column}.npy", mmap_mode="r") for column in COLUMNS}
+        return TransactionStore.from_arrays(meta["symbols"], **columns)
+
+    def save(self, source_path, store: TransactionStore):
+        """Write a snapshot of a parsed source file."""
+        snapshot = self._path(source_path)
+        snapshot.mkdir(parents=True, exist_ok=True)
+        for column in COLUMNS:
+            np.save(snapshot / f"{column}.npy", getattr(store, column))
+
+        # The header goes last, so a half-written snapshot never looks valid.
+        meta = {"key": self._key(source_path), "symbols": [str(symbol) for symbol in store.symbols]}
+        with open(snapshot / "meta.json", "w", encoding="utf-8") as file:
+            json.dump(meta, file)
@@ -0,0 +1,73 @@
+"""bench_aggregates.py - Portfolio aggregates over a large transaction store.
+
+Builds a Portfolio over a synthetic store, priced by MockDataSource, and times:
+
+    prices     fetching the latest price of every ticker (the mock's histories are made up beforehand)
+    cold       the first metrics(), computing every row
+    warm       metrics() again, with nothing changed
+    tick       a price update for 1% of tickers, then metrics() and the portfolio totals
+    totals     get_value, cost_basis and gain_loss with nothing changed
+    xirr       the portfolio XIRR, every transaction included
+
+Run from the repository root:
+
+    python -m benchmarks.bench_aggregates --tickers 2000 --transactions 1000000
+"""
+import time
+
+import click
+
+from DataSources.mock import MockDataSource
+from benchmarks.synthetic import book
+from portfolio import Portfolio
+from transaction_store import TransactionStore
+
+
+def _timed(call):
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def run(tickers=1000, transactions=100_000, years=5, seed=0):
+    """Seconds for each aggregate, keyed by name."""
+    store = TransactionStore.from_frame(book(tickers, transactions, years, seed=seed))
+    source = MockDataSource(seed=seed)
+    portfolio = Portfolio(data_sources=[source], store=store, fetch_prices=False)
+    moved = portfolio.tickers()[::100]
+    for ticker in portfolio.tickers():
+        source.bars(ticker)
+
+    def tick():
+        portfolio.update_prices({ticker: portfolio.prices[ticker] * 1.01 for ticker in moved})
+        portfolio.metrics()
+        portfolio.get_value()
+
+    def totals():
+        portfolio.get_value()
+        portfolio.cost_basis()
+        portfolio.gain_loss()
+
+    return {
+        "prices": _timed(portfolio.get_latest_prices),
+        "cold": _timed(portfolio.metrics),
+        "warm": _timed(portfolio.metrics),
+        "tick": _timed(tick),
+        "totals": _timed(totals),
+        "xirr": _timed(portfolio.get_xirr),
+    }
+
+
+@click.command()
+@click.option("--tickers", default=1000, help="Number of distinct tickers.")
+@click.option("--transactions", default=100_000, help="Number of buys and sells.")
+@click.option("--years", default=5, help="Years of history.")
+@click.option("--seed", default=0)
+def main(tickers, transactions, years, seed):
+    print(f"{transactions:,} transactions over {tickers} tickers and {years} years")
+    for name, seconds in run(tickers, transactions, years, seed).items():
+        print(f"{name:8} {seconds * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
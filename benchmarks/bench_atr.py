@@ -0,0 +1,64 @@
+"""bench_atr.py - ATR and trailing stop computation over many tickers.
+
+Takes `bars` daily bars of every ticker from MockDataSource and times:
+
+    batch        indicators.trailing_stops, every ticker at once
+    states       an AtrState per ticker, built from its history one bar at a time
+    update       folding one new bar into every ticker's AtrState
+    tick         an intraday price tick on every ticker's AtrState
+
+Run from the repository root:
+
+    python -m benchmarks.bench_atr --tickers 3000 --bars 250
+"""
+import time
+
+import click
+import pandas as pd
+
+from DataSources.mock import MockDataSource
+from benchmarks.synthetic import symbols
+from indicators import AtrState, trailing_stops
+
+
+def _timed(call):
+    started = time.perf_counter()
+    result = call()
+    return time.perf_counter() - started, result
+
+
+def run(tickers=1000, bars=250, period=14, seed=0):
+    """Seconds for each computation, keyed by name."""
+    source = MockDataSource(seed=seed)
+    # One bar beyond the history, to fold in afterwards.
+    history = {ticker: source.bars(ticker).iloc[-bars - 1:] for ticker in symbols(tickers)}
+    ohlcv = {ticker: frame.iloc[:-1] for ticker, frame in history.items()}
+
+    batch, _ = _timed(lambda: trailing_stops(ohlcv, period))
+    states_seconds, states = _timed(lambda: {ticker: AtrState.from_history(frame, period)
+                                             for ticker, frame in ohlcv.items()})
+
+    def update():
+        for ticker, state in states.items():
+            bar = history[ticker].iloc[-1]
+            state.update(bar.name, bar["High"], bar["Low"], bar["Close"])
+
+    now = pd.Timestamp.now()
+    update_seconds, _ = _timed(update)
+    tick_seconds, _ = _timed(lambda: [state.tick(now, state.close * 1.01) for state in states.values()])
+    return {"batch": batch, "states": states_seconds, "update": update_seconds, "tick": tick_seconds}
+
+
+@click.command()
+@click.option("--tickers", default=1000, help="Number of tickers.")
+@click.option("--bars", default=250, help="Bars of history per ticker.")
+@click.option("--period", default=14, help="ATR period.")
+@click.option("--seed", default=0)
+def main(tickers, bars, period, seed):
+    print(f"{tickers} tickers x {bars} bars, ATR({period})")
+    for name, seconds in run(tickers, bars, period, seed).items():
+        print(f"{name:8} {seconds * 1000:9.2f} ms ({seconds / tickers * 1e6:,.1f} us per ticker)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""bench_budget.py - Expansion, ledger output and forecasting of a large budget.
+
+Builds a budget of many entries spread over every kind of recurrence rule and times expanding it over a multi-year
+horizon, writing the schedule out as ledger text, projecting daily balances and answering what-ifs on them. Run
+from the repository root:
+
+    python -m benchmarks.bench_budget --entries 500 --years 10
+"""
+import time
+
+import click
+import numpy as np
+
+from budget import Budget, BudgetEntry, DateRange, Monthly, SemiMonthly, Weekly
+from forecast import Forecast
+
+RULES = [
+    lambda rng: Monthly(day=int(rng.integers(1, 32))),
+    lambda rng: SemiMonthly(),
+    lambda rng: Weekly(weekday=int(rng.integers(0, 7)), every=int(rng.integers(1, 3)), start="2020-01-06"),
+    lambda rng: DateRange("2020-01-31", month_interval=int(rng.integers(1, 4))),
+]
+
+
+def synthetic_budget(entries, seed=0) -> Budget:
+    rng = np.random.default_rng(seed)
+    return Budget([
+        BudgetEntry(name=f"entry {i}", amount=round(float(rng.uniform(5, 3000)), 2), interval=RULES[i % len(RULES)](rng),
+                    payer_account="Assets:Checking", payee_account=f"Expenses:Entry{i}")
+        for i in range(entries)
+    ])
+
+
+@click.command()
+@click.option("--entries", default=500, help="Number of budget entries.")
+@click.option("--years", default=10, help="Length of the horizon.")
+@click.option("--seed", default=0)
+def main(entries, years, seed):
+    budget = synthetic_budget(entries, seed)
+    start = np.datetime64("2025-01-01")
+    end = (start.astype("datetime64[Y]") + np.timedelta64(years, "Y")).astype("datetime64[D]")
+
+    started = time.perf_counter()
+    schedule = budget.expand(start, end)
+    expanded = time.perf_counter() - started
+
+    started = time.perf_counter()
+    size = sum(len(text) for text in budget.ledger(start, end))
+    written = time.perf_counter() - started
+
+    print(f"{entries} entries over {years} years: {len(schedule.dates):,} occurrences")
+    print(f"expand {expanded * 1000:7.1f} ms")
+    print(f"ledger {written * 1000:7.1f} ms ({size / 2 ** 20:.1f} MiB of text)")
+
+    started = time.perf_counter()
+    forecast = Forecast(budget, start, end, opening={"Assets:Checking": 10_000.0})
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    date, lowest = forecast.lowest("Assets:Checking")
+    overdraft = forecast.first_overdraft("Assets:Checking")
+    queried = time.perf_counter() - started
+    print(f"forecast {built * 1000:5.1f} ms for {len(forecast.dates):,} days x {len(forecast.accounts)} accounts, "
+          f"lowest/overdraft {queried * 1000:.2f} ms (lowest ${lowest:,.0f} on {date.date()}, overdrawn {overdraft})")
+
+    change = BudgetEntry(name="entry 0", amount=1.0, interval=Monthly(day=1), payer_account="Assets:Checking",
+                         payee_account="Expenses:Entry0")
+    started = time.perf_counter()
+    for _ in range(100):
+        forecast.what_if(add=[change], remove=["entry 0"]).first_overdraft("Assets:Checking")
+    print(f"what-if  {(time.perf_counter() - started) * 10:5.2f} ms per change and query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""bench_import.py - Startup cost of the CLI.
+
+Times fresh interpreters running `main.py --help` and importing the main modules, and lists the slowest imports
+reported by `python -X importtime`. Run from the repository root:
+
+    python -m benchmarks.bench_import --runs 10
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "main.py --help": ["main.py", "--help"],
+    "import main": ["-c", "import main"],
+    "import portfolio": ["-c", "import portfolio"],
+    "import DataSources.yahoo": ["-c", "import DataSources.yahoo"],
+}
+
+
+def _run(args):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def _slowest_imports(args, top):
+    """The `top` imports with the largest cumulative time, from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+@click.command()
+@click.option("--runs", default=10, help="Interpreters started per command.")
+@click.option("--top", default=10, help="Slowest imports to list for main.py --help.")
+def main(runs, top):
+    for label, args in COMMANDS.items():
+        try:
+            times = [_run(args) for _ in range(runs)]
+        except subprocess.CalledProcessError as e:
+            print(f"{label:28} failed: {e.stderr.decode().strip().splitlines()[-1]}")
+            continue
+        print(f"{label:28} median {statistics.median(times) * 1000:7.1f} ms, min {min(times) * 1000:7.1f} ms")
+
+    print("\nSlowest imports for main.py --help:")
+    for cumulative, name in _slowest_imports(["main.py", "--help"], top):
+        print(f"{cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
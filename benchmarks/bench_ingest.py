@@ -0,0 +1,66 @@
+"""bench_ingest.py - Ingest throughput of every way a book can be loaded.
+
+Writes a synthetic book as CSV and as a ledger journal, then times reading the CSV whole and in chunks, the journal,
+and the snapshot of the CSV. Run from the repository root:
+
+    python -m benchmarks.bench_ingest --tickers 500 --transactions 1000000 --years 10
+"""
+import os
+import tempfile
+import time
+
+import click
+
+from PortfolioSources.csv import CsvPortfolioSource
+from PortfolioSources.ledgercli import LedgerPortfolioSource
+from PortfolioSources.snapshot import SnapshotCache
+from benchmarks.synthetic import book, write_csv, write_ledger
+
+
+def _timed(load):
+    started = time.perf_counter()
+    rows = load()
+    return time.perf_counter() - started, rows
+
+
+def _read(source):
+    with source as opened:
+        return len(opened.store)
+
+
+def run(tickers=100, transactions=100_000, years=5, seed=0, chunksize=100_000):
+    """Seconds to load the book each way, keyed by how."""
+    frame = book(tickers, transactions, years, seed=seed)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "book.csv")
+        ledger_path = os.path.join(directory, "book.ledger")
+        write_csv(csv_path, frame)
+        write_ledger(ledger_path, frame)
+
+        results = {
+            "csv": _timed(lambda: _read(CsvPortfolioSource(csv_path))),
+            "csv_chunked": _timed(lambda: _read(CsvPortfolioSource(csv_path, chunksize=chunksize))),
+            "ledger": _timed(lambda: _read(LedgerPortfolioSource(ledger_path))),
+        }
+
+        snapshots = SnapshotCache(os.path.join(directory, ".snapshots"))
+        with CsvPortfolioSource(csv_path) as source:
+            snapshots.save(csv_path, source.store)
+        results["snapshot"] = _timed(lambda: len(snapshots.load(csv_path)))
+    return {name: seconds for name, (seconds, _) in results.items()}
+
+
+@click.command()
+@click.option("--tickers", default=100, help="Number of distinct tickers.")
+@click.option("--transactions", default=100_000, help="Number of buys and sells.")
+@click.option("--years", default=5, help="Years of history.")
+@click.option("--chunksize", default=100_000, help="Rows per chunk for the chunked CSV read.")
+@click.option("--seed", default=0)
+def main(tickers, transactions, years, chunksize, seed):
+    print(f"{transactions:,} transactions over {tickers} tickers and {years} years")
+    for name, seconds in run(tickers, transactions, years, seed, chunksize).items():
+        print(f"{name:12} {seconds:7.3f} s ({transactions / seconds:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
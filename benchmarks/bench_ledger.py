@@ -0,0 +1,57 @@
+"""bench_ledger.py - Parse throughput of the ledger-cli portfolio source.
+
+Writes a synthetic journal of buy and sell entries to a temporary file and times LedgerPortfolioSource over it.
+Run from the repository root:
+
+    python -m benchmarks.bench_ledger --entries 100000
+"""
+import os
+import random
+import tempfile
+import time
+
+import click
+
+from PortfolioSources.ledgercli import LedgerPortfolioSource
+
+
+def write_journal(path, entries, tickers, seed=0):
+    """Write `entries` entries, alternating the explicit price and implied price styles."""
+    rng = random.Random(seed)
+    symbols = [f"T{i:04d}" for i in range(tickers)]
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(entries):
+            ticker = rng.choice(symbols)
+            quantity = rng.randint(1, 100) * (1 if rng.random() < 0.7 else -1)
+            price = rng.uniform(5, 500)
+            date = f"20{10 + i * 10 // entries:02d}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+            file.write(f"{date} * Trade {ticker}\n")
+            if i % 2:
+                file.write(f"    Assets:Investments:Stocks:{ticker}  {quantity} {ticker} @ ${price:.2f}\n"
+                           f"    Assets:Investments:Cash\n\n")
+            else:
+                file.write(f"    Assets:Investments:Stocks:{ticker}  {quantity} {ticker}\n"
+                           f"    Assets:Investments:Cash  ${-quantity * price:,.2f}\n\n")
+
+
+@click.command()
+@click.option('--entries', type=int, default=100_000, help='Number of entries in the synthetic journal.')
+@click.option('--tickers', type=int, default=300, help='Number of distinct commodities.')
+def main(entries, tickers):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.ledger")
+        write_journal(path, entries, tickers)
+        size = os.path.getsize(path)
+
+        started = time.perf_counter()
+        with LedgerPortfolioSource(path) as source:
+            parsed = source.entries
+            positions = len(source.positions)
+        elapsed = time.perf_counter() - started
+
+    print(f"{parsed} entries ({size / 1e6:.1f} MB) into {positions} positions in {elapsed:.3f}s: "
+          f"{parsed / elapsed:,.0f} entries/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""bench_lots.py - Lot matching throughput of each policy.
+
+Builds a synthetic history of buys and partial sells spread over many tickers and times LotBook.from_store on it under
+each policy. Run from the repository root:
+
+    python -m benchmarks.bench_lots --fills 500000 --tickers 200
+"""
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from lots import POLICIES, LotBook
+from transaction_store import TransactionStore
+
+
+def synthetic_store(fills, tickers, sell_ratio=0.3, seed=0) -> TransactionStore:
+    """A store of `fills` buys and sells in date order. Sells larger than the holding are left to LotBook.unmatched."""
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, tickers, fills)
+    quantities = rng.integers(1, 100, fills) * np.where(rng.random(fills) < sell_ratio, -1, 1)
+    dates = np.datetime64("2010-01-01") + np.sort(rng.integers(0, 365 * 15, fills)).astype("timedelta64[D]")
+    return TransactionStore.from_frame(pd.DataFrame({
+        "Ticker": np.array([f"T{i:04d}" for i in range(tickers)])[codes],
+        "Date": dates.astype("datetime64[ns]"),
+        "Price": rng.uniform(5, 500, fills),
+        "Quantity": quantities,
+    }))
+
+
+@click.command()
+@click.option("--fills", default=500_000, help="Number of buys and sells.")
+@click.option("--tickers", default=200, help="Number of distinct tickers.")
+@click.option("--seed", default=0)
+def main(fills, tickers, seed):
+    store = synthetic_store(fills, tickers, seed=seed)
+    print(f"{len(store):,} fills over {tickers} tickers")
+    for policy in POLICIES:
+        started = time.perf_counter()
+        book = LotBook.from_store(store, policy)
+        matched = time.perf_counter() - started
+        started = time.perf_counter()
+        realized = book.realized()
+        summary = book.summary()
+        reported = time.perf_counter() - started
+        print(f"{policy:9} {matched:6.2f} s ({len(store) / matched:,.0f} fills/s), {len(realized):,} lot closes, "
+              f"{sum(book.unmatched.values()):,.0f} unmatched, realized ${summary.to_numpy().sum():,.0f}, "
+              f"report {reported:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
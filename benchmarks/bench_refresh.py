@@ -0,0 +1,79 @@
+"""bench_refresh.py - Price and bar refresh against a slow, unreliable mock source.
+
+Times, for a universe of tickers served by MockDataSource with the given latency and failure rate:
+
+    cold         CachedDataSource downloading a year of bars into an empty bar store
+    warm         the same refresh again, served from the store
+    stale        the refresh once the store is past max_age, fetching only new bars
+    concurrent   one fetch scheduler request per ticker
+    exhausted    the same against a source that always fails, until every request gives up
+    failover     latest prices through a SourceRouter whose first source keeps failing
+
+Run from the repository root:
+
+    python -m benchmarks.bench_refresh --tickers 500 --latency 0.05 --failure-rate 0.1
+"""
+import os
+import tempfile
+import time
+
+import click
+import pandas as pd
+
+from DataSources.fetch import get_scheduler
+from DataSources.mock import MockDataSource
+from DataSources.router import SourceRouter
+from DataSources.store import BarStore, CachedDataSource
+from benchmarks.synthetic import symbols
+
+
+def _timed(call):
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def run(tickers=100, latency=0.01, failure_rate=0.0, seed=0):
+    """Seconds for each refresh, keyed by name."""
+    universe = list(symbols(tickers))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        source = MockDataSource(universe, seed=seed, latency=latency)
+        cached = CachedDataSource(source, BarStore(os.path.join(directory, "bars.sqlite")))
+        results["cold"] = _timed(lambda: cached.refresh(universe, period="1y"))
+        results["warm"] = _timed(lambda: cached.refresh(universe, period="1y"))
+        cached.max_age = pd.Timedelta(0)
+        results["stale"] = _timed(lambda: cached.refresh(universe, period="1y"))
+        cached.store._connection.close()
+
+    # The scheduler retries failed requests itself, so failures cost time here rather than answers.
+    flaky = MockDataSource(universe, seed=seed, latency=latency, failure_rate=failure_rate)
+    results["concurrent"] = _timed(lambda: get_scheduler().map(flaky, flaky.get_latest_price, universe,
+                                                               base_delay=latency, jitter=0))
+
+    # Every attempt fails: each request must still resolve (to None) once its retries run out.
+    failing = MockDataSource(universe, seed=seed, latency=latency, failure_rate=1.0)
+    exhausted = {}
+    results["exhausted"] = _timed(lambda: exhausted.update(get_scheduler().map(
+        failing, failing.get_latest_price, universe, max_retries=2, base_delay=latency, jitter=0)))
+    assert set(exhausted) == set(universe) and not any(exhausted.values()), "failed requests did not resolve to None"
+
+    backup = MockDataSource(universe, seed=seed + 1, latency=latency, failure_rate=failure_rate)
+    router = SourceRouter([failing, backup], failure_threshold=3)
+    results["failover"] = _timed(lambda: [router.get_latest_prices(universe) for _ in range(10)]) / 10
+    return results
+
+
+@click.command()
+@click.option("--tickers", default=100, help="Number of tickers to refresh.")
+@click.option("--latency", default=0.01, help="Seconds each mock request takes.")
+@click.option("--failure-rate", default=0.0, help="Fraction of mock requests that fail.")
+@click.option("--seed", default=0)
+def main(tickers, latency, failure_rate, seed):
+    print(f"{tickers} tickers, {latency * 1000:.0f} ms per request, {failure_rate:.0%} failing")
+    for name, seconds in run(tickers, latency, failure_rate, seed).items():
+        print(f"{name:12} {seconds:7.3f} s")
+
+
+if __name__ == "__main__":
+    main()
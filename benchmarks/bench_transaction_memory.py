@@ -0,0 +1,90 @@
+"""bench_transaction_memory.py - Memory cost of a transaction book.
+
+Builds the same book of transactions three ways and reports the bytes each row costs, as traced by tracemalloc:
+
+    dict       the previous Transaction layout, with a per-instance __dict__ and a copy of the ticker per row
+    slots      Transaction as it is now, slotted with interned tickers
+    store      TransactionStore columns
+
+Rows are built the way CsvPortfolioSource reads them, with the dates, prices and quantities counted alongside.
+Run from the repository root:
+
+    python -m benchmarks.bench_transaction_memory --rows 1000000 --tickers 500
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+import click
+import numpy as np
+import pandas as pd
+
+from transaction import Action, Transaction
+from transaction_store import TransactionStore
+
+
+class DictTransaction:
+    """The Transaction layout before slots, for comparison."""
+
+    def __init__(self, ticker, date, price, quantity, action=None, account=None):
+        self.ticker = ticker
+        self.date = date
+        self.price = price
+        self.quantity = quantity
+        self.amount = price * quantity
+        self.action = action or (Action.BUY if quantity > 0 else Action.SELL)
+
+
+def synthetic_frame(rows, tickers, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64("2010-01-01") + rng.integers(0, 365 * 15, rows).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "Ticker": np.array([f"T{i:04d}" for i in range(tickers)])[rng.integers(0, tickers, rows)],
+        "Date": dates.astype("datetime64[ns]"),
+        "Price": rng.uniform(5, 500, rows),
+        "Quantity": rng.integers(1, 100, rows).astype(np.float64),
+    })
+
+
+def _objects(cls, frame, copy_tickers):
+    # Tickers parsed from a file arrive as a fresh string per row; copying them here stands in for that.
+    tickers = [ticker.encode().decode() for ticker in frame["Ticker"]] if copy_tickers else list(frame["Ticker"])
+    dates, prices, quantities = list(frame["Date"]), frame["Price"].tolist(), frame["Quantity"].tolist()
+    return [cls(tickers[i], dates[i], prices[i], quantities[i]) for i in range(len(frame))]
+
+
+def _traced(build):
+    """The result of build(), the bytes it left allocated and the seconds it took."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+@click.command()
+@click.option("--rows", default=1_000_000, help="Number of transactions.")
+@click.option("--tickers", default=500, help="Number of distinct tickers.")
+@click.option("--seed", default=0)
+def main(rows, tickers, seed):
+    frame = synthetic_frame(rows, tickers, seed)
+    print(f"{rows:,} transactions over {tickers} tickers")
+
+    layouts = {
+        "dict": lambda: _objects(DictTransaction, frame, copy_tickers=True),
+        "slots": lambda: _objects(Transaction, frame, copy_tickers=True),
+        "store": lambda: TransactionStore.from_frame(frame),
+    }
+    for name, build in layouts.items():
+        result, size, elapsed = _traced(build)
+        shell = f", {sys.getsizeof(result[0])} B object" if isinstance(result, list) else ""
+        print(f"{name:6} {size / rows:7.1f} B/transaction ({size / 2 ** 20:7.1f} MiB){shell}, built in {elapsed:.2f} s")
+        del result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""run.py - Run the offline benchmarks over growing sizes, for regressions and scaling curves.
+
+Each benchmark is run at its base size multiplied by every scale given, and its timings are printed one row per scale,
+with how much slower each row is than the first. `--json` also writes every timing, to compare a later run against.
+Nothing touches the network. Run from the repository root:
+
+    python -m benchmarks.run --scale 1 --scale 4 --scale 16 --json bench.json
+"""
+import json
+
+import click
+
+from benchmarks import bench_aggregates, bench_atr, bench_ingest, bench_refresh
+
+# The size arguments each benchmark is scaled by, at scale 1.
+BENCHMARKS = {
+    "ingest": (bench_ingest.run, {"tickers": 100, "transactions": 20_000}),
+    "refresh": (bench_refresh.run, {"tickers": 25}),
+    "aggregates": (bench_aggregates.run, {"tickers": 100, "transactions": 20_000}),
+    "atr": (bench_atr.run, {"tickers": 100}),
+}
+
+
+def run(names, scales, seed=0):
+    """{benchmark: {scale: {timing: seconds}}} for every benchmark named, at every scale."""
+    results = {}
+    for name in names:
+        bench, sizes = BENCHMARKS[name]
+        results[name] = {}
+        for scale in scales:
+            print(f"{name} x{scale}...")
+            results[name][scale] = bench(**{key: int(size * scale) for key, size in sizes.items()}, seed=seed)
+    return results
+
+
+def print_results(results):
+    for name, by_scale in results.items():
+        scales = list(by_scale)
+        timings = list(by_scale[scales[0]])
+        print(f"\n{name}")
+        print(f"{'scale':>8}" + "".join(f"{timing:>18}" for timing in timings))
+        for scale in scales:
+            cells = []
+            for timing in timings:
+                seconds = by_scale[scale][timing]
+                first = by_scale[scales[0]][timing]
+                cells.append(f"{seconds * 1000:9.1f} ms" + (f" x{seconds / first:.1f}" if first and scale != scales[0]
+                                                            else ""))
+            print(f"{scale:>8g}" + "".join(f"{cell:>18}" for cell in cells))
+
+
+@click.command()
+@click.option("--bench", "names", multiple=True, type=click.Choice(list(BENCHMARKS)),
+              help="Benchmark to run. Repeat for several; defaults to all of them.")
+@click.option("--scale", "scales", multiple=True, type=float, help="Size multiple to run at. Repeat for a curve.")
+@click.option("--seed", default=0)
+@click.option("--json", "json_path", type=click.Path(dir_okay=False), help="Also write every timing to this file.")
+def main(names, scales, seed, json_path):
+    results = run(names or list(BENCHMARKS), scales or (1, 2, 4), seed)
+    print_results(results)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({name: {str(scale): timings for scale, timings in by_scale.items()}
+                       for name, by_scale in results.items()}, f, indent=2)
+        print(f"\nTimings written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
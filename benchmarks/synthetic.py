@@ -0,0 +1,88 @@
+"""synthetic.py - Synthetic portfolio books of any size, written as CSV or ledger-cli files.
+
+A book is `transactions` buys and sells spread over `tickers` tickers and the `years` up to today. Each ticker opens
+with a large buy and sells less than it buys on average, so positions seldom go short. Prices drift along a random
+walk per ticker. The same arguments always make the same book.
+
+    python -m benchmarks.synthetic book.csv --tickers 500 --transactions 1000000 --years 10
+"""
+import click
+import numpy as np
+import pandas as pd
+
+
+def symbols(tickers):
+    return np.array([f"T{i:04d}" for i in range(tickers)])
+
+
+def book(tickers=100, transactions=10_000, years=5, sell_ratio=0.3, seed=0) -> pd.DataFrame:
+    """A book as a DataFrame with Ticker, Date, Action, Quantity, Price and Cost Basis columns, in date order."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.now().normalize()
+    days = int(365.25 * years)
+
+    # Every ticker's first transaction is its opening buy; the rest land anywhere after it.
+    codes = np.concatenate([np.arange(tickers), rng.integers(0, tickers, max(0, transactions - tickers))])[:transactions]
+    opened = rng.integers(0, days // 2 + 1, tickers)
+    offsets = np.where(np.arange(len(codes)) < tickers, opened[codes],
+                       opened[codes] + rng.integers(0, days - opened[codes] + 1))
+
+    sells = (rng.random(len(codes)) < sell_ratio) & (np.arange(len(codes)) >= tickers)
+    quantity = np.where(np.arange(len(codes)) < tickers, 1000, rng.integers(1, 100, len(codes)))
+    quantity = np.where(sells, -quantity, quantity)
+
+    start_price = rng.uniform(5, 500, tickers)
+    drift = rng.normal(0.05, 0.2, tickers)
+    price = start_price[codes] * np.exp(drift[codes] * offsets / 365.25 + rng.normal(0, 0.05, len(codes)))
+
+    frame = pd.DataFrame({
+        "Ticker": symbols(tickers)[codes],
+        "Date": end - pd.to_timedelta(days - offsets, unit="D"),
+        "Action": np.where(sells, "Sell", "Buy"),
+        "Quantity": quantity,
+        "Price": price.round(2),
+    })
+    frame["Cost Basis"] = (frame["Price"] * frame["Quantity"]).round(2)
+    return frame.sort_values("Date", kind="stable", ignore_index=True)
+
+
+def _dollars(values: pd.Series) -> pd.Series:
+    return values.map("${:,.2f}".format)
+
+
+def write_csv(path, frame: pd.DataFrame, dollars=True):
+    """Write a book as the CSV portfolio source reads it, with $ amounts like a broker export unless dollars is False."""
+    if dollars:
+        frame = frame.assign(**{column: _dollars(frame[column]) for column in ("Price", "Cost Basis")})
+    frame.to_csv(path, index=False, date_format="%Y-%m-%d")
+
+
+def write_ledger(path, frame: pd.DataFrame):
+    """Write a book as a ledger-cli journal, one entry per transaction priced per unit."""
+    dates = frame["Date"].dt.strftime("%Y-%m-%d")
+    tickers = frame["Ticker"]
+    text = (dates + " * " + frame["Action"] + " " + tickers + "\n    Assets:Investments:Stocks:" + tickers + "  "
+            + frame["Quantity"].astype(str) + " " + tickers + " @ " + _dollars(frame["Price"])
+            + "\n    Assets:Investments:Cash\n\n")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("".join(text))
+
+
+@click.command()
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--tickers", default=100, help="Number of distinct tickers.")
+@click.option("--transactions", default=10_000, help="Number of buys and sells.")
+@click.option("--years", default=5, help="Years of history, up to today.")
+@click.option("--seed", default=0)
+def main(path, tickers, transactions, years, seed):
+    """Write a synthetic book to PATH, as a ledger journal if PATH ends in .ledger and as CSV otherwise."""
+    frame = book(tickers, transactions, years, seed=seed)
+    if path.endswith(".ledger"):
+        write_ledger(path, frame)
+    else:
+        write_csv(path, frame)
+    print(f"Wrote {len(frame):,} transactions over {tickers} tickers to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,164 +1,246 @@
-from collections import namedtuple
-from datetime import datetime
-from email.policy import default
-from sqlite3 import Date
-from tracemalloc import start
-from dateutil.relativedelta import relativedelta
-from dateutil.parser import parse as parse_date
-import click
-from daterangeparser import parse as dr_parse
-
-class DateRange:
-    def __init__(self, start_date: datetime, end_date: datetime=None, year_interval:int=0, month_interval:int=0, week_interval:int=0, day_interval:int=1) -> None:
-        self.start_date = start_date
-        if end_date:
-            self.end_date = end_date
-        else: 
-            self.end_date = self.start_date + relativedelta(days=10)
-        self.years = year_interval
-        self.months = month_interval
-        self.weeks = week_interval
-        self.days = day_interval
-        self.current_date = self.start_date
-
-        print(start_date, end_date)
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.current_date < self.end_date:
-            ret = self.current_date
-            self.current_date += relativedelta(year=self.years, months=self.months, weeks=self.weeks, days=self.days)
-            return ret
-        else:
-            raise StopIteration
-
-class Monthly:
-    def __init__(self, start_date: datetime=None, end_date: datetime=None, day: int=None) -> None:
-        if start_date and end_date:
-            self.set_range(start_date, end_date)
-        if day:
-            self.day = day
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.current_date < self.end_date:
-            ret = self.current_date
-
-            self.current_date = self.current_date.replace(month=(self.current_date.month + 1) % 12)
-
-            return ret
-        else:
-            raise StopIteration    
-
-    def set_day(self, day:int):
-        # bump the start date to nearest
-        if day:
-            self.day = day
-            if self.start_date.day > self.day:
-                self.start_date = self.start_date.replace(month=(self.start_date.month + 1) % 12)
-            else:
-                self.start_date = self.start_date.replace(day=self.day)
-
-            self.current_date = self.start_date
-
-    def set_range(self, start:datetime, end:datetime):
-        self.start_date = start
-        self.end_date = end
-        self.set_day(self.day)
-
-
-
-class BiMonthly:
-    def __init__(self, start_date: datetime=None, end_date: datetime=None, days: list[int]=[1,15]) -> None:
-        if start_date and end_date:
-            self.set_range(start_date, end_date)
-
-        if days:
-            self.days = days
-            for i in self.days:
-                if self.start_date.day > i:
-                    self.start_date = self.start_date
-                
-                self.current_date = self.start_date  
-
-    def __call__(self):
-        return self
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.current_date < self.end_date:
-            ret = self.current_date
-
-            # if current date is the last,
-            if self.current_date.day == self.days[-1]:
-                # reset the index to 0
-                self.days_idx = 0
-                self.current_date = self.current_date.replace(month=(self.current_date.month + 1) % 12)
-            else:
-                self.occurrence_idx += 1
-
-            self.current_date = self.current_date.replace(day=self.occurrence[self.occurrence_idx])
-
-            return ret
-        else:
-            raise StopIteration
-
-    def set_day(self, day):
-        # bump start date to next nearest
-
-    def set_range(self, start:datetime, end:datetime):
-        self.start_date = start
-        self.end_date = end
-
-months = {
-    "January":1,
-    "February":2,
-    "March":3,
-    "April":4,
-    "May":5,
-    "June":6,
-    "July":7,
-    "August":8,
-    "September":9,
-    "October":10,
-    "November":11,
-    "December":12
-}
-
-monthly = relativedelta(months=+1)
-daily = relativedelta(day=1)
-
-class Budget:
-    def __init__(self, entries=None) -> None:
-        self.budget_entries = entries
-        self.now = datetime.now()
-        pass
-
-    def generate_budget(self, datestr: str=None):
-        print(dr_parse(datestr))
-        for entry in self.budget_entries:
-            for date_instance in entry.interval().set_range(*dr_parse(datestr)):
-                print(budgetEntryString(date_instance, entry.name, entry.amount, entry.payer_account, entry.payee_account))
-
-BudgetEntry = namedtuple("BudgetEntry", "name amount interval payer_account payee_account")
-budgetEntryString = lambda date, name, amount, payer_account, payee_account: f"{date.date()} {name}\n  {payer_account}  {amount}\n  {payee_account}\n"
-
-entries = [
-    BudgetEntry(name="paycheck", amount=1700.0, interval=BiMonthly(), payer_account="Income:SkySync", payee_account="Assets:USAA:Checking"),
-    BudgetEntry(name="rent", amount=1300.0, interval=Monthly(day=3), payer_account="Assets:USAA:Checking", payee_account="Expenses:Housing:Rent")
-]
-
-@click.command()
-@click.option('-d', '--date', '_date', default=datetime.now())
-def main(_date):
-    myBudget = Budget(entries)
-    myBudget.generate_budget(_date)
-
-if __name__ == '__main__':
-    main()
\ No newline at end of file
+"""budget.py - Recurring budget entries, expanded into a dated schedule and written out as ledger text.
+
+Every entry has a recurrence rule. A rule expands a whole horizon in one go: the months (or weeks, or steps) the
+horizon spans become a numpy array, and the dates of the rule fall out of a little arithmetic on it, with no
+stepping one date at a time. Days past the end of a short month land on its last day, and months and years roll
+over like any other number, so schedules cross December without special cases.
+
+Dates are numpy datetime64[D]; horizons include their start and exclude their end.
+"""
+import sys
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime
+from typing import Iterator
+
+import click
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+DAY = np.timedelta64(1, "D")
+MONTH = np.timedelta64(1, "M")
+NO_DATES = np.empty(0, dtype="datetime64[D]")
+
+
+def _day(value) -> np.datetime64:
+    """A date, datetime or ISO string as a datetime64[D]."""
+    return np.datetime64(value, "D")
+
+
+def _weekday(dates):
+    """Monday is 0. The epoch, 1970-01-01, was a Thursday."""
+    return (dates.astype(np.int64) + 3) % 7
+
+
+def _month_days(months: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """The given days of each month, clipped to the month's last day, as a (months x days) array."""
+    first = months.astype("datetime64[D]")
+    length = ((months + MONTH).astype("datetime64[D]") - first).astype(np.int64)
+    return first[:, None] + (np.minimum(days[None, :], length[:, None]) - 1).astype("timedelta64[D]")
+
+
+class Rule(ABC):
+    """A recurrence rule: the dates something happens on.
+
+    Args:
+        start (optional): The first date the rule can fall on, e.g. when a lease begins. Also anchors rules that skip
+            periods (every other week, every third month); without it they count from the start of the horizon.
+        end (optional): The date the rule stops, exclusive.
+    """
+
+    def __init__(self, start=None, end=None) -> None:
+        self.start = None if start is None else _day(start)
+        self.end = None if end is None else _day(end)
+
+    def dates(self, start, end) -> np.ndarray:
+        """Every date of the rule from start up to (not including) end, in order."""
+        start, end = _day(start), _day(end)
+        anchor = self.start if self.start is not None else start
+        if self.start is not None:
+            start = max(start, self.start)
+        if self.end is not None:
+            end = min(end, self.end)
+        if start >= end:
+            return NO_DATES
+        return self._dates(start, end, anchor)
+
+    @abstractmethod
+    def _dates(self, start, end, anchor) -> np.ndarray:
+        """The dates from start to end, already clipped to the rule's own, with periods counted from anchor."""
+
+
+class Monthly(Rule):
+    """On a day (or days) of every month, or of every `every` months. Day 31 means the last day of the month."""
+
+    def __init__(self, day=1, every: int = 1, start=None, end=None) -> None:
+        super().__init__(start, end)
+        self.days = np.unique(np.atleast_1d(np.asarray(day, dtype=np.int64)))
+        if self.days.min() < 1 or self.days.max() > 31:
+            raise ValueError(f"Days of the month run from 1 to 31, not {day}.")
+        if every < 1:
+            raise ValueError("A monthly rule must repeat at least every month.")
+        self.every = every
+
+    def _dates(self, start, end, anchor) -> np.ndarray:
+        months = np.arange(start.astype("datetime64[M]"), (end - DAY).astype("datetime64[M]") + MONTH)
+        if self.every > 1:
+            months = months[(months - anchor.astype("datetime64[M]")).astype(np.int64) % self.every == 0]
+        # Clipping can land two days on one (the 30th and 31st of February).
+        dates = np.unique(_month_days(months, self.days))
+        return dates[(dates >= start) & (dates < end)]
+
+
+class SemiMonthly(Monthly):
+    """Twice a month, on the 1st and 15th by default."""
+
+    def __init__(self, days=(1, 15), every: int = 1, start=None, end=None) -> None:
+        super().__init__(days, every, start, end)
+
+
+# Twice a month, as the entries below (and budgets written against them) call it.
+BiMonthly = SemiMonthly
+
+
+class Weekly(Rule):
+    """On a weekday (Monday is 0) of every week, or of every `every` weeks."""
+
+    def __init__(self, weekday: int = 0, every: int = 1, start=None, end=None) -> None:
+        super().__init__(start, end)
+        if not 0 <= weekday <= 6:
+            raise ValueError(f"Weekdays run from 0 (Monday) to 6, not {weekday}.")
+        if every < 1:
+            raise ValueError("A weekly rule must repeat at least every week.")
+        self.weekday = weekday
+        self.every = every
+
+    def _dates(self, start, end, anchor) -> np.ndarray:
+        step = 7 * self.every
+        first = anchor + np.timedelta64(int(self.weekday - _weekday(anchor)) % 7, "D")
+        skipped = max(0, -(-int((start - first) / DAY) // step))
+        return np.arange(first + np.timedelta64(skipped * step, "D"), end, np.timedelta64(step, "D"))
+
+
+class DateRange(Rule):
+    """Every fixed step from a start date, the step being any mix of years, months, weeks and days. Daily by default.
+
+    Each date is counted from the start date rather than from the date before, so a range starting on the 31st lands
+    on the last day of short months and goes back to the 31st after them.
+    """
+
+    def __init__(self, start_date, end_date=None, year_interval: int = 0, month_interval: int = 0,
+                 week_interval: int = 0, day_interval: int = None) -> None:
+        super().__init__(start_date, end_date)
+        self.months = 12 * year_interval + month_interval
+        if day_interval is None:
+            day_interval = 0 if self.months or week_interval else 1
+        self.days = 7 * week_interval + day_interval
+        if self.months < 0 or self.days < 0 or self.months == self.days == 0:
+            raise ValueError("A date range must step forward.")
+
+    def _dates(self, start, end, anchor) -> np.ndarray:
+        # Enough steps to pass the end, as no step is shorter than its shortest months.
+        steps = np.arange(int((end - anchor) / DAY) // (28 * self.months + self.days) + 1)
+        if self.months:
+            month = anchor.astype("datetime64[M]")
+            day = int((anchor - month.astype("datetime64[D]")) / DAY) + 1
+            dates = _month_days(month + steps * self.months * MONTH, np.array([day]))[:, 0]
+        else:
+            dates = np.full(len(steps), anchor)
+        dates = dates + (steps * self.days).astype("timedelta64[D]")
+        return dates[(dates >= start) & (dates < end)]
+
+
+months = {
+    "January": 1,
+    "February": 2,
+    "March": 3,
+    "April": 4,
+    "May": 5,
+    "June": 6,
+    "July": 7,
+    "August": 8,
+    "September": 9,
+    "October": 10,
+    "November": 11,
+    "December": 12
+}
+
+BudgetEntry = namedtuple("BudgetEntry", "name amount interval payer_account payee_account")
+# Every occurrence of every entry over a horizon, in date order: entries holds the index of each one's BudgetEntry.
+Schedule = namedtuple("Schedule", "dates entries amounts")
+
+budgetEntryString = lambda date, name, amount, payer_account, payee_account: \
+    f"{date} {name}\n  {payer_account}  {-amount}\n  {payee_account}\n"
+
+
+def parse_horizon(datestr: str = None):
+    """The (start, end) of a date range like "Jan 2025 - Dec 2026", end exclusive. Defaults to the coming year."""
+    if not datestr:
+        now = datetime.now()
+        return _day(now), _day(now + relativedelta(years=1))
+    from daterangeparser import parse as dr_parse
+    start, end = dr_parse(datestr)
+    return _day(start), _day(end or start) + DAY
+
+
+class Budget:
+    def __init__(self, entries=None) -> None:
+        self.budget_entries = list(entries or [])
+        self.now = datetime.now()
+
+    def expand(self, start, end) -> Schedule:
+        """Every occurrence of every entry from start up to (not including) end, as flat arrays in date order."""
+        dates = [entry.interval.dates(start, end) for entry in self.budget_entries]
+        entries = np.repeat(np.arange(len(dates)), [len(d) for d in dates])
+        dates = np.concatenate(dates) if dates else NO_DATES
+        amounts = np.array([entry.amount for entry in self.budget_entries], dtype=np.float64)[entries]
+        order = np.argsort(dates, kind="stable")
+        return Schedule(dates[order], entries[order], amounts[order])
+
+    def ledger(self, start, end, chunk_size=10_000) -> Iterator[str]:
+        """Ledger text of the schedule, in chunks of chunk_size transactions.
+
+        All that changes between occurrences of an entry is the date, so each entry is formatted once and every
+        occurrence is its date joined onto that text.
+        """
+        schedule = self.expand(start, end)
+        texts = np.array([budgetEntryString("", entry.name, entry.amount, entry.payer_account, entry.payee_account)
+                          for entry in self.budget_entries] or [""], dtype=object)
+        days = np.datetime_as_string(schedule.dates, unit="D").astype(object)
+        for begin in range(0, len(days), chunk_size):
+            chunk = slice(begin, begin + chunk_size)
+            yield "\n".join(days[chunk] + texts[schedule.entries[chunk]]) + "\n"
+
+    def generate_budget(self, datestr: str = None, out=sys.stdout):
+        """Write the ledger text of every entry over a date range (see parse_horizon)."""
+        for text in self.ledger(*parse_horizon(datestr)):
+            out.write(text)
+
+
+entries = [
+    BudgetEntry(name="paycheck", amount=1700.0, interval=BiMonthly(), payer_account="Income:SkySync", payee_account="Assets:USAA:Checking"),
+    BudgetEntry(name="rent", amount=1300.0, interval=Monthly(day=3), payer_account="Assets:USAA:Checking", payee_account="Expenses:Housing:Rent")
+]
+
+
+@click.command()
+@click.option('-d', '--date', '_date', default=None, help='Date range to budget over, e.g. "Jan 2025 - Dec 2026". '
+                                                           'Defaults to the coming year.')
+@click.option('-f', '--forecast', 'accounts', multiple=True,
+              help='Forecast the daily balance of this account instead of writing the ledger. Repeatable.')
+@click.option('-o', '--opening', type=(str, float), multiple=True, metavar='ACCOUNT AMOUNT',
+              help='Opening balance of an account for the forecast. Repeatable.')
+def main(_date, accounts, opening):
+    myBudget = Budget(entries)
+    if not accounts:
+        myBudget.generate_budget(_date)
+        return
+
+    from forecast import Forecast, print_forecast
+    forecast = Forecast(myBudget, *parse_horizon(_date), opening=dict(opening))
+    for account in accounts:
+        print_forecast(forecast, account)
+
+
+if __name__ == '__main__':
+    main()
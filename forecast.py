@@ -0,0 +1,216 @@
+"""forecast.py - Daily account balances projected from a budget.
+
+A budget's schedule becomes a (days x accounts) grid of flows: each occurrence of an entry takes its amount out of the
+payer account and puts it into the payee account on its date. A cumulative sum down the days turns the flows into the
+balance of every account at the end of every day.
+
+Questions about a stretch of days (the lowest balance, the first day below some level) go to a sparse table over each
+account's balances, built once per account on first use: the minimum of every run of 1, 2, 4, ... days from every
+day. Any range is covered by two of those runs, so its minimum takes two lookups, and the first day below a level
+takes one lookup per power of two.
+
+Each entry's dates are kept, so a what-if (entries added or taken away) expands only the entries it changes and
+recomputes only the accounts they touch.
+"""
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from budget import DAY, Budget, BudgetEntry, _day, parse_horizon
+
+
+class RangeMin:
+    """Minimum of any range of a series in O(1), and the first value below a level from any point in O(log n).
+
+    levels[j][i] is the minimum of values[i:i + 2 ** j].
+    """
+
+    def __init__(self, values: np.ndarray) -> None:
+        self.levels = [np.asarray(values, dtype=np.float64)]
+        width = 1
+        while 2 * width <= len(self.levels[0]):
+            below = self.levels[-1]
+            self.levels.append(np.minimum(below[:-width], below[width:]))
+            width *= 2
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def min(self, lo, hi):
+        """The minimum of values[lo:hi], for ints or arrays of them. Ranges must not be empty."""
+        lo, hi = np.asarray(lo), np.asarray(hi)
+        if np.any(hi <= lo):
+            raise ValueError("Range minimum of an empty range.")
+        level = np.floor(np.log2(hi - lo)).astype(np.int64)
+        if level.ndim == 0:
+            values = self.levels[int(level)]
+            return min(values[lo], values[hi - (1 << int(level))])
+        result = np.empty(level.shape)
+        for j in np.unique(level):
+            at = level == j
+            result[at] = np.minimum(self.levels[j][lo[at]], self.levels[j][hi[at] - (1 << int(j))])
+        return result
+
+    def first_below(self, threshold, lo=0) -> int:
+        """The first index from lo with a value below threshold, or -1 if there is none.
+
+        Whole runs that stay at or above the threshold are skipped, longest first, so the skips add up to exactly the
+        distance to the first value below it.
+        """
+        i = lo
+        for j in range(len(self.levels) - 1, -1, -1):
+            values = self.levels[j]
+            if i < len(values) and values[i] >= threshold:
+                i += 1 << j
+        return i if i < len(self) else -1
+
+
+class Forecast:
+    """Daily balances of every account in a budget over a horizon.
+
+    Args:
+        budget (Budget): The entries to project.
+        start, end (optional): The horizon, end exclusive. Defaults to the coming year.
+        opening (Dict[str, float], optional): Balances going into the first day. Other accounts open at zero.
+    """
+
+    def __init__(self, budget: Budget, start=None, end=None, opening: Dict[str, float] = None) -> None:
+        if start is None or end is None:
+            default_start, default_end = parse_horizon()
+            start = default_start if start is None else start
+            end = default_end if end is None else end
+        self.start, self.end = _day(start), _day(end)
+        self.dates = pd.DatetimeIndex(np.arange(self.start, self.end, DAY), name="Date")
+        self.opening = dict(opening or {})
+        self.entries: List[BudgetEntry] = list(budget.budget_entries)
+        self._rows = [self._expand(entry) for entry in self.entries]
+        self.accounts: List[str] = []
+        self._add_accounts(self.entries)
+
+        self.flows = self._flows(self.entries, self._rows)
+        self.balances = self._opening() + self.flows.cumsum(axis=0)
+        self._indexes: Dict[str, RangeMin] = {}
+
+    def _expand(self, entry: BudgetEntry) -> np.ndarray:
+        """The day (row) of every occurrence of an entry."""
+        return ((entry.interval.dates(self.start, self.end) - self.start) / DAY).astype(np.int64)
+
+    def _add_accounts(self, entries: Iterable[BudgetEntry]):
+        self.columns = {account: i for i, account in enumerate(self.accounts)}
+        for entry in entries:
+            for account in (entry.payer_account, entry.payee_account):
+                if account not in self.columns:
+                    self.columns[account] = len(self.accounts)
+                    self.accounts.append(account)
+
+    def _opening(self) -> np.ndarray:
+        return np.array([self.opening.get(account, 0.0) for account in self.accounts], dtype=np.float64)
+
+    def _flows(self, entries: List[BudgetEntry], rows: List[np.ndarray]) -> np.ndarray:
+        """Net flow into every account on every day, from the given entries' occurrences."""
+        counts = [len(r) for r in rows]
+        days = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        amounts = np.repeat(np.array([entry.amount for entry in entries], dtype=np.float64), counts)
+        payers = np.repeat(np.array([self.columns[entry.payer_account] for entry in entries], dtype=np.int64), counts)
+        payees = np.repeat(np.array([self.columns[entry.payee_account] for entry in entries], dtype=np.int64), counts)
+
+        flows = np.zeros((len(self.dates), len(self.accounts)))
+        np.add.at(flows, (days, payers), -amounts)
+        np.add.at(flows, (days, payees), amounts)
+        return flows
+
+    def what_if(self, add: Iterable[BudgetEntry] = (), remove: Iterable[str] = ()) -> "Forecast":
+        """The forecast with entries added, or taken away by name. To change an entry, take it away and add it back.
+
+        Only the added entries are expanded, and only the accounts either side touches are summed again; everything
+        else, range indexes included, is shared with this forecast.
+        """
+        add, remove = list(add), set(remove)
+        unknown = remove - {entry.name for entry in self.entries}
+        if unknown:
+            raise ValueError(f"No budget entries named {', '.join(sorted(unknown))}")
+
+        forecast = object.__new__(Forecast)
+        forecast.start, forecast.end, forecast.dates, forecast.opening = self.start, self.end, self.dates, self.opening
+        forecast.entries, forecast._rows, removed, removed_rows = [], [], [], []
+        for entry, rows in zip(self.entries, self._rows):
+            if entry.name in remove:
+                removed.append(entry._replace(amount=-entry.amount))
+                removed_rows.append(rows)
+            else:
+                forecast.entries.append(entry)
+                forecast._rows.append(rows)
+        added_rows = [forecast._expand(entry) for entry in add]
+        forecast.entries += add
+        forecast._rows += added_rows
+
+        forecast.accounts = list(self.accounts)
+        forecast._add_accounts(add)
+        new = len(forecast.accounts) - len(self.accounts)
+        delta = forecast._flows(removed + add, removed_rows + added_rows)
+        touched = sorted({forecast.columns[entry.payer_account] for entry in removed + add}
+                         | {forecast.columns[entry.payee_account] for entry in removed + add})
+
+        forecast.flows = np.pad(self.flows, ((0, 0), (0, new)))
+        forecast.balances = np.pad(self.balances, ((0, 0), (0, new)))
+        forecast.flows[:, touched] += delta[:, touched]
+        forecast.balances[:, touched] = forecast._opening()[touched] + forecast.flows[:, touched].cumsum(axis=0)
+        touched_accounts = {forecast.accounts[column] for column in touched}
+        forecast._indexes = {account: index for account, index in self._indexes.items()
+                             if account not in touched_accounts}
+        return forecast
+
+    def _column(self, account: str) -> int:
+        if account not in self.columns:
+            raise KeyError(f"No budget entry pays into or out of {account}")
+        return self.columns[account]
+
+    def _index(self, account: str) -> RangeMin:
+        if account not in self._indexes:
+            self._indexes[account] = RangeMin(self.balances[:, self._column(account)])
+        return self._indexes[account]
+
+    def _row(self, date, default) -> int:
+        if date is None:
+            return default
+        return int(np.clip((_day(date) - self.start) / DAY, 0, len(self.dates)))
+
+    def balance(self, account: str) -> pd.Series:
+        """The balance of an account at the end of every day."""
+        return pd.Series(self.balances[:, self._column(account)], index=self.dates, name=account)
+
+    def frame(self) -> pd.DataFrame:
+        """The balance of every account at the end of every day, one column per account."""
+        return pd.DataFrame(self.balances, index=self.dates, columns=pd.Index(self.accounts, name="Account"))
+
+    def min_balance(self, account: str, start=None, end=None) -> float:
+        """The lowest end-of-day balance of an account from start up to (not including) end."""
+        return float(self._index(account).min(self._row(start, 0), self._row(end, len(self.dates))))
+
+    def lowest(self, account: str, start=None, end=None):
+        """The (date, balance) of an account's lowest balance from start to end, the first such date on a tie."""
+        lo = self._row(start, 0)
+        lowest = self.min_balance(account, start, end)
+        row = self._index(account).first_below(np.nextafter(lowest, np.inf), lo)
+        return self.dates[row], lowest
+
+    def first_below(self, account: str, threshold: float, start=None):
+        """The first date from start on which an account ends the day below threshold, or None if it never does."""
+        row = self._index(account).first_below(threshold, self._row(start, 0))
+        return None if row < 0 else self.dates[row]
+
+    def first_overdraft(self, account: str, start=None):
+        """The first date from start on which an account ends the day below zero, or None if it never does."""
+        return self.first_below(account, 0.0, start)
+
+
+def print_forecast(forecast: Forecast, account: str):
+    """The low point, first overdraft and month-end balances of an account."""
+    date, lowest = forecast.lowest(account)
+    overdraft = forecast.first_overdraft(account)
+    print(account)
+    print(f"\tLowest Balance: ${lowest:,.2f} on {date.date()}")
+    print(f"\tFirst Overdraft: {overdraft.date() if overdraft is not None else 'never'}")
+    for month, balance in forecast.balance(account).resample("ME").last().items():
+        print(f"\t{month:%Y-%m}: ${balance:,.2f}")
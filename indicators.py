@@ -0,0 +1,283 @@
+"""indicators.py - Technical indicators for many tickers at once.
+
+The bar histories of all tickers are stacked into one matrix per field, one column per ticker and one row per bar
+(aligned on bar number, so tickers with different calendars or history lengths sit side by side, padded with NaN).
+Indicators are then computed for every ticker in the same vectorized pass instead of one library call per ticker.
+
+ATR follows TA-Lib: the first bar has no previous close and is left out, the first ATR is the mean of the next `period`
+true ranges, and Wilder's smoothing is applied from there on.
+"""
+import math
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+STOP_COLUMNS = ["Latest Price", "ATR", "Close_Minus_ATR_15", "Close_Plus_ATR_3"]
+
+
+def stack(ohlcv: Dict[str, pd.DataFrame], fields=("High", "Low", "Close")):
+    """Stack per-ticker bar frames into one (bars x tickers) matrix per field.
+
+    Returns:
+        Tuple[List[str], np.ndarray, Dict[str, np.ndarray]]: The tickers (matrix columns), the number of bars of each
+        ticker, and the matrix of each field.
+    """
+    frames = {ticker: frame for ticker, frame in ohlcv.items() if frame is not None and len(frame)}
+    tickers = list(frames)
+    lengths = np.array([len(frame) for frame in frames.values()], dtype=np.int64)
+    rows = int(lengths.max()) if len(lengths) else 0
+    matrices = {field: np.full((rows, len(tickers)), np.nan) for field in fields}
+    if not tickers:
+        return tickers, lengths, matrices
+
+    # One concat and one scatter per field; pulling columns out frame by frame costs more than the ATR itself.
+    stacked = pd.concat(frames.values(), ignore_index=True)
+    bars = np.arange(len(stacked)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    columns = np.repeat(np.arange(len(tickers)), lengths)
+    for field in fields:
+        matrices[field][bars, columns] = stacked[field].to_numpy(dtype=np.float64)
+    return tickers, lengths, matrices
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """True range of every bar, column-wise.
+
+    The first bar has no previous close, so its true range is just its high - low. TA-Lib leaves it undefined, and
+    `atr` never uses it.
+    """
+    previous = np.full_like(close, np.nan)
+    previous[1:] = close[:-1]
+    return np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period=14) -> np.ndarray:
+    """Average true range of every bar, column-wise, matching TA-Lib's ATR. Bars before the first full period are NaN.
+    """
+    ranges = true_range(high, low, close)
+    result = np.full_like(ranges, np.nan)
+    if len(ranges) <= period:
+        return result
+
+    result[period] = ranges[1:period + 1].mean(axis=0)
+    # Wilder's smoothing: each bar moves the average 1/period of the way toward its true range. The recursion runs
+    # over bars only; every ticker is updated at once.
+    for row in range(period + 1, len(ranges)):
+        result[row] = result[row - 1] + (ranges[row] - result[row - 1]) / period
+    return result
+
+
+def calculate_atr(ohlcv: Dict[str, pd.DataFrame], period=14) -> Dict[str, np.ndarray]:
+    """ATR for every bar of every ticker, keyed by ticker."""
+    tickers, lengths, matrices = stack(ohlcv)
+    values = atr(matrices["High"], matrices["Low"], matrices["Close"], period)
+    return {ticker: values[:length, column] for column, (ticker, length) in enumerate(zip(tickers, lengths))}
+
+
+def trailing_stops(ohlcv: Dict[str, pd.DataFrame], period=14) -> pd.DataFrame:
+    """The latest close, ATR and ATR trailing stops of every ticker.
+
+    Returns:
+        pd.DataFrame: Indexed by ticker, with the STOP_COLUMNS. ATR and stops are NaN for tickers with too short a
+        history.
+    """
+    tickers, lengths, matrices = stack(ohlcv)
+    close = matrices["Close"]
+    values = atr(matrices["High"], matrices["Low"], close, period)
+
+    last, columns = lengths - 1, np.arange(len(tickers))
+    latest_close = close[last, columns]
+    latest_atr = values[last, columns]
+    return pd.DataFrame({
+        "Latest Price": latest_close,
+        "ATR": latest_atr,
+        "Close_Minus_ATR_15": latest_close - latest_atr * 1.5,
+        "Close_Plus_ATR_3": latest_close + latest_atr * 3,
+    }, index=pd.Index(tickers, name="Ticker"))
+
+
+class AtrState:
+    """Running ATR and trailing stops of one ticker, updated one bar at a time.
+
+    Folding in a bar costs O(1) and needs nothing but this state, so stops stay current without refetching or
+    recomputing any history. Fed a ticker's whole history, the ATR equals that of `atr`. The latest bar may be
+    updated again while it is still forming (intraday, say); the state before it is kept so that a revised bar
+    replaces it instead of counting twice.
+    """
+
+    def __init__(self, period=14, bars=0, range_sum=0.0, atr=None, close=None, high=None, low=None, date=None,
+                 previous=None):
+        self.period = period
+        self.bars = bars
+        self.range_sum = range_sum
+        self.atr = atr
+        self.close = close
+        self.high = high
+        self.low = low
+        self.date = date
+        # (bars, range_sum, atr, close) before the latest bar.
+        self.previous = previous
+
+    @classmethod
+    def from_history(cls, frame: pd.DataFrame, period=14):
+        """Build a state from a DataFrame of bars with High, Low and Close columns, indexed by date."""
+        state = cls(period)
+        for date, high, low, close in zip(frame.index, frame["High"], frame["Low"], frame["Close"]):
+            state.update(date, high, low, close)
+        return state
+
+    def update(self, date, high, low, close):
+        """Fold in a bar. A bar dated like the latest one replaces it; an older bar is ignored, as is one with a
+        missing (NaN) or infinite price, such as Yahoo's placeholder for a session that has not traded yet.
+        """
+        if not (math.isfinite(high) and math.isfinite(low) and math.isfinite(close)):
+            return
+        date = pd.Timestamp(date)
+        if self.date is not None and date < self.date:
+            return
+        if self.date is not None and date == self.date:
+            self.bars, self.range_sum, self.atr, self.close = self.previous
+        else:
+            self.previous = (self.bars, self.range_sum, self.atr, self.close)
+
+        if self.close is not None:
+            true_range = max(high - low, abs(high - self.close), abs(low - self.close))
+            if self.bars <= self.period:
+                # Still seeding: the first ATR is the mean of the first `period` true ranges.
+                self.range_sum += true_range
+                if self.bars == self.period:
+                    self.atr = self.range_sum / self.period
+            else:
+                self.atr += (true_range - self.atr) / self.period
+        self.bars += 1
+        self.close, self.high, self.low, self.date = close, high, low, date
+
+    def tick(self, date, price):
+        """Fold in a price quote, extending the latest bar if it is from the same day or opening a new one."""
+        date = pd.Timestamp(date).normalize()
+        if self.date is not None and date == self.date:
+            self.update(date, max(self.high, price), min(self.low, price), price)
+        else:
+            self.update(date, price, price, price)
+
+    @property
+    def close_minus_atr_15(self):
+        return None if self.atr is None else self.close - self.atr * 1.5
+
+    @property
+    def close_plus_atr_3(self):
+        return None if self.atr is None else self.close + self.atr * 3
+
+
+class IndicatorStore:
+    """AtrState of every ticker in a SQLite file, keyed by (source, ticker, period). Shares the bar store's file."""
+
+    def __init__(self, path=".bars.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS atr_state (
+                source TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                period INTEGER NOT NULL,
+                bars INTEGER, range_sum REAL, atr REAL, close REAL, high REAL, low REAL, date TEXT,
+                previous_bars INTEGER, previous_range_sum REAL, previous_atr REAL, previous_close REAL,
+                PRIMARY KEY (source, ticker, period)
+            ) WITHOUT ROWID;
+        """)
+
+    def load(self, source, tickers, period=14) -> Dict[str, AtrState]:
+        """The stored state of each ticker that has one."""
+        tickers = list(tickers)
+        states = {}
+        for i in range(0, len(tickers), 500):
+            chunk = tickers[i:i + 500]
+            query = "SELECT * FROM atr_state WHERE source = ? AND period = ? AND ticker IN ({})".format(
+                ", ".join("?" * len(chunk)))
+            with self._lock:
+                rows = self._connection.execute(query, [source, period, *chunk]).fetchall()
+            for _, ticker, period, bars, range_sum, atr, close, high, low, date, *previous in rows:
+                states[ticker] = AtrState(period, bars, range_sum, atr, close, high, low,
+                                          None if date is None else pd.Timestamp(date), tuple(previous))
+        return states
+
+    def save(self, source, states: Dict[str, AtrState]):
+        rows = [(source, ticker, state.period, state.bars, state.range_sum, state.atr, state.close, state.high,
+                 state.low, None if state.date is None else state.date.isoformat(), *(state.previous or (None,) * 4))
+                for ticker, state in states.items()]
+        with self._lock, self._connection:
+            self._connection.executemany(f"INSERT OR REPLACE INTO atr_state VALUES ({', '.join('?' * 14)})", rows)
+
+    def close(self):
+        self._connection.close()
+
+
+class TrailingStops:
+    """ATR trailing stops kept up to date incrementally.
+
+    The first refresh of a ticker seeds its state from a month of history. After that only bars from the latest one
+    on are asked for, and each is folded into the stored state in O(1). Between bars, `tick` moves the stops with
+    live quotes without any download at all.
+    """
+
+    def __init__(self, source, store: IndicatorStore = None, period=14, seed_period="1mo"):
+        self.source = source
+        self.store = store or IndicatorStore()
+        self.period = period
+        self.seed_period = seed_period
+        self.name = getattr(source, "name", type(source).__name__.lower())
+        self.states: Dict[str, AtrState] = {}
+
+    def refresh(self, tickers) -> pd.DataFrame:
+        """Bring the state of the tickers up to date with their latest bars, and return their stops."""
+        tickers = list(dict.fromkeys(tickers))
+        self.states.update(self.store.load(self.name, [t for t in tickers if t not in self.states], self.period))
+
+        seed = [ticker for ticker in tickers if ticker not in self.states or self.states[ticker].date is None]
+        if seed:
+            history = self.source.download_historical_data(seed, period=self.seed_period)
+            for ticker in seed:
+                frame = history.get(ticker)
+                if frame is not None and len(frame):
+                    self.states[ticker] = AtrState.from_history(frame, self.period)
+
+        # Tickers are asked for in groups sharing the date of their latest bar, which is fetched again in case it
+        # was still forming last time.
+        groups = defaultdict(list)
+        for ticker in tickers:
+            if ticker in self.states and ticker not in seed:
+                groups[self.states[ticker].date].append(ticker)
+        for latest, group in groups.items():
+            bars = self.source.download_historical_data(group, period=self.seed_period, start=latest)
+            for ticker in group:
+                frame = bars.get(ticker)
+                if frame is None:
+                    continue
+                state = self.states[ticker]
+                for date, high, low, close in zip(frame.index, frame["High"], frame["Low"], frame["Close"]):
+                    state.update(date, high, low, close)
+
+        self.store.save(self.name, {ticker: self.states[ticker] for ticker in tickers if ticker in self.states})
+        return self.stops(tickers)
+
+    def tick(self, prices: Dict[str, float], now=None):
+        """Move the stops with live quotes, without downloading anything. Call refresh for the tickers first."""
+        now = now or pd.Timestamp.now()
+        for ticker, price in prices.items():
+            if ticker in self.states and price is not None:
+                self.states[ticker].tick(now, price)
+
+    def stops(self, tickers=None) -> pd.DataFrame:
+        """The latest close, ATR and stops of the tickers, in the same shape as trailing_stops."""
+        tickers = list(self.states) if tickers is None else tickers
+        states = [self.states.get(ticker) for ticker in tickers]
+        frame = pd.DataFrame([(np.nan, np.nan) if state is None else
+                              (state.close, np.nan if state.atr is None else state.atr) for state in states],
+                             columns=["Latest Price", "ATR"], index=pd.Index(tickers, name="Ticker"), dtype=float)
+        frame["Close_Minus_ATR_15"] = frame["Latest Price"] - frame["ATR"] * 1.5
+        frame["Close_Plus_ATR_3"] = frame["Latest Price"] + frame["ATR"] * 3
+        return frame
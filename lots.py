@@ -0,0 +1,260 @@
+"""lots.py - Tax lot accounting.
+
+Every buy opens a lot; every sell is matched against open lots of the same ticker and closes them, in whole or in part,
+realizing a gain on each. Which lots a sell closes is the policy:
+
+    fifo      oldest lot first (a deque, O(1) per match)
+    lifo      newest lot first (a deque, O(1) per match)
+    hifo      highest cost first, which defers the most gain (a heap, O(log n) per match)
+    specific  the lots named for each sell (a dict by lot id, O(1) per match), oldest first for anything unnamed
+
+A gain is long term when the lot was held more than `long_term_days` (a year), and short term otherwise.
+"""
+import heapq
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from transaction_store import TransactionStore
+
+SHORT_TERM = "short"
+LONG_TERM = "long"
+
+# Open lots are kept as [lot_id, acquired (ns), price, remaining quantity] lists, which is the cheapest mutable record.
+LOT_ID, ACQUIRED, PRICE, REMAINING = range(4)
+
+
+class FifoQueue:
+    """Open lots of one ticker, oldest first."""
+
+    def __init__(self):
+        self._lots = deque()
+
+    def push(self, lot):
+        self._lots.append(lot)
+
+    def head(self):
+        return self._lots[0]
+
+    def pop(self):
+        self._lots.popleft()
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __iter__(self):
+        return iter(self._lots)
+
+
+class LifoQueue(FifoQueue):
+    """Open lots of one ticker, newest first."""
+
+    def head(self):
+        return self._lots[-1]
+
+    def pop(self):
+        self._lots.pop()
+
+
+class HifoQueue:
+    """Open lots of one ticker, highest price first. Ties go to the older lot."""
+
+    def __init__(self):
+        self._heap = []
+
+    def push(self, lot):
+        heapq.heappush(self._heap, (-lot[PRICE], lot[LOT_ID], lot))
+
+    def head(self):
+        return self._heap[0][2]
+
+    def pop(self):
+        heapq.heappop(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (lot for _, _, lot in self._heap)
+
+
+class SpecificIdQueue:
+    """Open lots of one ticker by lot id. Without a selection, lots go oldest first.
+
+    Lot ids are also kept in a deque in the order they were opened. Lots closed by id are left in it and skipped once
+    they reach the front, so the oldest open lot is found in amortized O(1) however many lots were closed before it.
+    """
+
+    def __init__(self):
+        self._lots: Dict[int, list] = {}
+        self._order = deque()
+
+    def push(self, lot):
+        self._lots[lot[LOT_ID]] = lot
+        self._order.append(lot[LOT_ID])
+
+    def head(self):
+        while self._order[0] not in self._lots:
+            self._order.popleft()
+        return self._lots[self._order[0]]
+
+    def pop(self):
+        del self._lots[self.head()[LOT_ID]]
+        self._order.popleft()
+
+    def get(self, lot_id):
+        return self._lots.get(lot_id)
+
+    def remove(self, lot_id):
+        del self._lots[lot_id]
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __iter__(self):
+        return iter(self._lots.values())
+
+
+POLICIES = {
+    "fifo": FifoQueue,
+    "lifo": LifoQueue,
+    "hifo": HifoQueue,
+    "specific": SpecificIdQueue,
+}
+
+
+class LotBook:
+    """Open lots and realized gains of many tickers under one matching policy.
+
+    Fills are processed in the order given, so feed them sorted by date (from_store does). Each fill has an id, its
+    position in that order by default; a buy's id is the id of the lot it opens. For the specific policy, `selections`
+    maps a sell's id to the (lot id, quantity) pairs it closes.
+
+    A sell larger than the open lots closes what there is; the rest is counted in `unmatched`.
+    """
+
+    def __init__(self, policy="fifo", long_term_days=365, selections: Dict[int, List[Tuple[int, float]]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown lot policy {policy}, expected one of {', '.join(POLICIES)}")
+        if selections and policy != "specific":
+            raise ValueError("Lot selections only apply to the specific policy.")
+        self.policy = policy
+        self.long_term_ns = pd.Timedelta(days=long_term_days).value
+        self.selections = selections or {}
+        self.queues: Dict[str, object] = {}
+        self.unmatched: Dict[str, float] = {}
+        self._fills = 0
+        # Realized gains as columns, one entry per lot (part) closed.
+        self._realized = {name: [] for name in ["ticker", "lot_id", "acquired", "sold", "quantity", "cost", "proceeds"]}
+
+    @classmethod
+    def from_store(cls, store: TransactionStore, policy="fifo", **kwargs):
+        """Process every transaction of a store, in date order. Fill ids are the row numbers in the store."""
+        book = cls(policy, **kwargs)
+        order = np.argsort(store.dates, kind="stable")
+        book.extend(store.symbols[store.codes[order]], store.dates[order].view(np.int64), store.prices[order],
+                    store.quantities[order], ids=order)
+        return book
+
+    def extend(self, tickers: Iterable[str], dates, prices, quantities, ids=None):
+        """Process many fills. Dates are anything pd.Timestamp accepts, or int nanoseconds."""
+        dates = np.asarray(dates)
+        if not np.issubdtype(dates.dtype, np.integer):
+            dates = pd.to_datetime(dates).asi8
+        ids = range(self._fills, self._fills + len(dates)) if ids is None else ids
+        for fill_id, ticker, date, price, quantity in zip(np.asarray(ids).tolist(), list(tickers), dates.tolist(),
+                                                          np.asarray(prices, dtype=np.float64).tolist(),
+                                                          np.asarray(quantities, dtype=np.float64).tolist()):
+            self.add(ticker, date, price, quantity, fill_id)
+
+    def add(self, ticker, date, price, quantity, fill_id=None):
+        """Process one fill: a positive quantity opens a lot, a negative one closes lots."""
+        if fill_id is None:
+            fill_id = self._fills
+        self._fills += 1
+        date = date if isinstance(date, int) else pd.Timestamp(date).value
+
+        queue = self.queues.get(ticker)
+        if queue is None:
+            queue = self.queues[ticker] = POLICIES[self.policy]()
+
+        if quantity > 0:
+            queue.push([fill_id, date, price, quantity])
+            return
+
+        remaining = -quantity
+        if fill_id in self.selections:
+            for lot_id, wanted in self.selections[fill_id]:
+                lot = queue.get(lot_id)
+                if lot is None:
+                    raise ValueError(f"Sell {fill_id} of {ticker} names lot {lot_id}, which is not open.")
+                take = min(wanted, lot[REMAINING], remaining)
+                self._close(ticker, lot, take, date, price)
+                remaining -= take
+                if lot[REMAINING] <= 0:
+                    queue.remove(lot_id)
+
+        while remaining > 0 and len(queue):
+            lot = queue.head()
+            take = min(lot[REMAINING], remaining)
+            self._close(ticker, lot, take, date, price)
+            remaining -= take
+            if lot[REMAINING] <= 0:
+                queue.pop()
+
+        if remaining > 0:
+            self.unmatched[ticker] = self.unmatched.get(ticker, 0.0) + remaining
+
+    def _close(self, ticker, lot, quantity, date, price):
+        lot[REMAINING] -= quantity
+        realized = self._realized
+        realized["ticker"].append(ticker)
+        realized["lot_id"].append(lot[LOT_ID])
+        realized["acquired"].append(lot[ACQUIRED])
+        realized["sold"].append(date)
+        realized["quantity"].append(quantity)
+        realized["cost"].append(quantity * lot[PRICE])
+        realized["proceeds"].append(quantity * price)
+
+    def _term(self, held_ns):
+        return np.where(held_ns > self.long_term_ns, LONG_TERM, SHORT_TERM)
+
+    def realized(self) -> pd.DataFrame:
+        """Every lot (or part of one) closed so far, with its gain and whether that gain is short or long term."""
+        frame = pd.DataFrame({name: np.asarray(values) for name, values in self._realized.items()})
+        for column in ["acquired", "sold"]:
+            frame[column] = pd.to_datetime(frame[column].astype(np.int64))
+        frame["gain"] = frame["proceeds"] - frame["cost"]
+        frame["term"] = self._term((frame["sold"] - frame["acquired"]).to_numpy().view(np.int64))
+        return frame
+
+    def open_lots(self) -> pd.DataFrame:
+        """Every open lot: ticker, lot_id, acquired, price and remaining quantity."""
+        rows = [(ticker, *lot) for ticker, queue in self.queues.items() for lot in queue if lot[REMAINING] > 0]
+        frame = pd.DataFrame(rows, columns=["ticker", "lot_id", "acquired", "price", "quantity"])
+        frame["acquired"] = pd.to_datetime(frame["acquired"].astype(np.int64))
+        return frame.sort_values(["ticker", "acquired", "lot_id"], ignore_index=True)
+
+    def unrealized(self, market_values: pd.Series, now=None) -> pd.DataFrame:
+        """Every open lot valued at the market, with its unrealized gain and the term it would be taxed at today."""
+        now = pd.Timestamp(now or pd.Timestamp.now())
+        frame = self.open_lots()
+        frame["cost"] = frame["price"] * frame["quantity"]
+        frame["market_value"] = market_values.reindex(frame["ticker"]).to_numpy(dtype=np.float64) * frame["quantity"]
+        frame["gain"] = frame["market_value"] - frame["cost"]
+        frame["term"] = self._term((now - frame["acquired"]).to_numpy().view(np.int64))
+        return frame
+
+    def summary(self, market_values: pd.Series = None, now=None) -> pd.DataFrame:
+        """Realized and (given market values) unrealized gains per ticker, split into short and long term."""
+        parts = {"realized": self.realized()}
+        if market_values is not None:
+            parts["unrealized"] = self.unrealized(market_values, now)
+        columns = {}
+        for kind, frame in parts.items():
+            table = frame.pivot_table(index="ticker", columns="term", values="gain", aggfunc="sum", fill_value=0.0)
+            for term in (SHORT_TERM, LONG_TERM):
+                columns[f"{kind}_{term}"] = table[term] if term in table else pd.Series(dtype=np.float64)
+        return pd.DataFrame(columns).fillna(0.0).rename_axis("Ticker")
@@ -1,58 +1,75 @@
-from pathlib import Path
-import pandas as pd
 import click
 
-from DataSources import yahoo
-from DataSources.yahoo import Yahoo
-from PortfolioSources.csv import CsvPortfolioSource
-from Report import basic
-from portfolio import Portfolio
+import registry
+
+
+def watch(portfolio, data_source, interval):
+    """Keep the portfolio in memory and alert on trailing stop crossings until interrupted."""
+    from indicators import TrailingStops
+    from watch import Watcher
+
+    # Live prices come straight from the wrapped source; the bar store only serves the history behind the stops.
+    watcher = Watcher(portfolio, data_source.source, TrailingStops(data_source), interval=interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
 
 
 @click.command()
 @click.option('--file', type=click.Path(exists=True), prompt='Enter file path:')
-def main(file):
+@click.option('--chunksize', type=int, default=None,
+              help='Stream the file in chunks of this many rows to bound memory use.')
+@click.option('--snapshot/--no-snapshot', default=True,
+              help='Reuse a binary snapshot of the parsed file when the file has not changed.')
+@click.option('--watch', 'watch_mode', is_flag=True,
+              help='Keep running after the report and alert when a price crosses its ATR trailing stop.')
+@click.option('--interval', type=float, default=60, help='Seconds between price polls in watch mode.')
+@click.option('--plugin', 'plugins', multiple=True, metavar='MODULE:FUNCTION',
+              help='A function called with the pipeline to register its own stages and hooks. Repeatable.')
+@click.option('--timings', is_flag=True, help='Print the time, rows and memory of every pipeline stage.')
+@click.option('--trace-memory', is_flag=True, help='Measure stage memory with tracemalloc. Slower, but per stage.')
+@click.option('--profile', is_flag=True, help='Profile the run with cProfile and tracemalloc and print the top entries.')
+@click.option('--metrics-json', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Write counters, latency histograms and any profile to this file as JSON.')
+def main(file, chunksize, snapshot, watch_mode, interval, plugins, timings, trace_memory, profile, metrics_json):
     """CLI interface for portfolio analysis."""
-    # Check file extension using pathlib, if 'ledger' is in extension then process as ledger, else process as a 'csv'.
-    file_path = Path(file)
-    portfolio_source = None
-
-    # Ingest data from file
-    if file_path.suffix == '.ledger':
-        raise NotImplementedError("Ledger file processing not implemented.")
-    elif file_path.suffix == '.csv':
-        portfolio_source = CsvPortfolioSource(file_path)
-        print("Processing csv file...")
-    else:
+    # Imported here rather than at the top so that --help does not pay for pandas and friends.
+    import metrics
+    from PortfolioSources.snapshot import SnapshotCache
+    from pipeline import Context, Pipeline, UnsupportedFileError, print_timings
+
+    _data_source = registry.data_source("cached", registry.data_source("yahoo"))
+
+    # Read, munge, repository, prices, filter and report; see pipeline.py.
+    # TODO add a way to handle N input files from arbitrary file types.
+    pipeline = Pipeline.default(trace_memory=trace_memory)
+    for plugin in plugins:
+        registry.load(plugin)(pipeline)
+
+    # An unchanged file is loaded from its snapshot without being parsed again.
+    context = Context(file, data_sources=[_data_source], snapshots=SnapshotCache() if snapshot else None,
+                      chunksize=chunksize)
+    try:
+        if profile:
+            with metrics.profile():
+                pipeline.run(context)
+        else:
+            pipeline.run(context)
+    except UnsupportedFileError:
         print("File type not supported.")
         return 1
 
-    # Spin up source contexts. We can do multiple sources in this line like so:
-    # with CsvPortfolio(file_path) as csv, LedgerPortfolio() as yahoo:
-    # TODO add a way to handle N input files from arbitrary file types.
-    with portfolio_source as _portfolio_source:
-        _data_source = Yahoo()
-
-        # Init portfolio
-        portfolio = Portfolio(data_sources=[_data_source], positions=_portfolio_source.positions)
-
-        portfolio.get_latest_prices()
-
-        print(f"Portfolio Value: ${portfolio.get_value():.2f}")
-        print(f"Cost Basis: ${portfolio.cost_basis():.2f}")
-        print(f"Gain/Loss: ${portfolio.gain_loss():.2f}, ({portfolio.gain_loss_percent()*100:.4f}%)")
-        print(f"Average Time Held: {portfolio.average_time_held()}")
-        print(f"ARR: {portfolio.get_annualized_return()*100:.4f}%")
-
-        # Same as above, but for each position.
-        for ticker, position in portfolio.positions.items():
-            print(f"{ticker}, status: {position.status}")
-            print(f"\tValue: ${position.get_value():.2f}")
-            print(f"\tQuantity: {position.get_quantity()}")
-            print(f"\tCost Basis: ${position.get_cost_basis():.2f}")
-            print(f"\tTotal Time Held: {position.get_time_held()}")
-            print(f"\tPercent Return: {position.get_return_percent()*100:.4f}%")
-            print(f"\tARR: {position.get_annualized_return()*100:.4f}%")
+    if timings:
+        print_timings(pipeline.timings)
+    if profile:
+        metrics.print_profile(metrics.get_metrics().last_profile)
+    if metrics_json:
+        metrics.export_json(metrics_json)
+
+    # The file has been written back and closed; the portfolio itself stays in memory.
+    if watch_mode:
+        watch(context.portfolio, _data_source, interval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""metrics.py - Counters, latency histograms and profiling, in place of progress printed from hot paths.
+
+Everything is recorded on one process wide Metrics object, through the functions of this module:
+
+    metrics.increment("cache.hits", 3, source="yahoo")
+    with metrics.timed("datasource.get_latest_prices", source="Yahoo"):
+        ...
+
+A metric is a name plus labels. Recording one is a dict lookup and an add under a lock, cheap enough for any path.
+snapshot() returns everything recorded as plain dicts and lists, and export_json() writes that out for dashboards.
+
+profile() runs a block under cProfile (and tracemalloc) and adds its slowest functions and largest allocation sites to
+the snapshot.
+"""
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets. Anything slower lands in a last, unbounded bucket.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Observations counted into buckets, with their count, sum, min and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """An upper bound on the q quantile: the top of the bucket it falls in, or the largest value seen."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        empty = not self.count
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": None if empty else self.min,
+            "max": None if empty else self.max,
+            "mean": None if empty else self.sum / self.count,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+            # Observations at or below each bound, cumulative as dashboards expect.
+            "buckets": {str(bound): sum(self.counts[:i + 1]) for i, bound in enumerate(self.buckets + ("inf",))},
+        }
+
+
+def _key(name, labels) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def _entry(key):
+    name, labels = key
+    return {"name": name, "labels": dict(labels)}
+
+
+class Metrics:
+    """Counters and histograms by name and labels, safe to record from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.last_profile = None
+
+    def increment(self, name, value=1, **labels):
+        """Add to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value, a latency in seconds say, in a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        """Record the wall time of a block in a histogram, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name, **labels):
+        """The value of a counter, 0 if it was never incremented."""
+        return self.counters.get(_key(name, labels), 0)
+
+    def histogram(self, name, **labels) -> Histogram:
+        """A histogram, or None if nothing was observed in it."""
+        return self.histograms.get(_key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.last_profile = None
+
+    def snapshot(self) -> dict:
+        """Everything recorded so far, as JSON serializable dicts and lists."""
+        with self._lock:
+            snapshot = {
+                "timestamp": time.time(),
+                "counters": [{**_entry(key), "value": value} for key, value in sorted(self.counters.items())],
+                "histograms": [{**_entry(key), **histogram.to_dict()}
+                               for key, histogram in sorted(self.histograms.items())],
+            }
+        if self.last_profile is not None:
+            snapshot["profile"] = self.last_profile
+        return snapshot
+
+    def export_json(self, path):
+        """Write the snapshot to a file, or to a writable object such as sys.stdout."""
+        if hasattr(path, "write"):
+            json.dump(self.snapshot(), path, indent=2)
+            return
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    @contextmanager
+    def profile(self, memory=True, top=25):
+        """Run a block under cProfile, and tracemalloc with memory, and keep the top entries of each.
+
+        tracemalloc slows allocation down considerably, so leave memory off when only the timings matter.
+        """
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                # What the profiler itself allocated is no part of the answer.
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ])
+                if tracing:
+                    tracemalloc.stop()
+
+            stats = pstats.Stats(profiler)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            self.last_profile = {
+                "functions": [{"function": f"{file}:{line}({function})", "calls": calls, "total": total,
+                               "cumulative": cumulative}
+                              for (file, line, function), (_, calls, total, cumulative, _) in functions],
+            }
+            if memory:
+                self.last_profile["memory"] = {
+                    "peak": peak,
+                    "sites": [{"site": str(stat.traceback), "size": stat.size, "count": stat.count}
+                              for stat in snapshot.statistics("lineno")[:top]],
+                }
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """The Metrics shared by everything in the process."""
+    return _metrics
+
+
+increment = _metrics.increment
+observe = _metrics.observe
+timed = _metrics.timed
+snapshot = _metrics.snapshot
+export_json = _metrics.export_json
+profile = _metrics.profile
+
+
+def print_profile(profile: dict):
+    """Print the slowest functions, and largest allocation sites, of a profile taken with profile()."""
+    print(f"{'Cumulative':>11}{'Total':>10}{'Calls':>10}  Function")
+    for entry in profile["functions"]:
+        print(f"{entry['cumulative']:>11.3f}{entry['total']:>10.3f}{entry['calls']:>10,}  {entry['function']}")
+    if "memory" in profile:
+        print(f"Peak traced memory: {profile['memory']['peak'] / 2 ** 20:,.1f} MiB")
+        for site in profile["memory"]["sites"]:
+            print(f"{site['size'] / 2 ** 20:>11.1f} MiB{site['count']:>10,}  {site['site']}")
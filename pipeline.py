@@ -0,0 +1,274 @@
+"""pipeline.py - The processing pipeline behind the CLI, with hooks before and after every stage.
+
+Data flows through these stages, in order:
+
+    read        open the portfolio source registered for the file, or load its snapshot
+    munge       gather the positions and transaction store read, and snapshot a freshly parsed file
+    repository  put them in a Portfolio
+    prices      fetch the latest price of every position
+    filter      compute the per-position metrics the reports read
+    report      print the summary
+
+Each stage takes a Context and leaves what it made on it for the stages after. Hooks registered before or after a
+stage are called with the same context, so custom analysis plugs in anywhere without a fork of main.py:
+
+    pipeline = Pipeline.default()
+
+    @pipeline.after("filter")
+    def largest(context):
+        print(context.metrics.nlargest(5, "value"))
+
+Hooks that need to hand something on to later hooks register it as a service on the context.
+
+Every stage is measured: its wall time, the rows it produced (the count a stage returns) and memory. By default memory
+is the process's peak resident set size after the stage, which costs nothing to read. With trace_memory, tracemalloc
+reports what each stage allocated and its own peak instead, at the cost of slowing allocation heavy stages down.
+"""
+import sys
+import time
+import tracemalloc
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import metrics
+import registry
+from portfolio import Portfolio
+from transaction_store import TransactionStore
+
+# allocated is the change in traced memory over the stage, None without trace_memory. peak is the most traced memory
+# above the start of the stage with trace_memory, and the process's peak resident set size without.
+StageTiming = namedtuple("StageTiming", "stage seconds rows allocated peak")
+
+
+class UnsupportedFileError(ValueError):
+    """No portfolio source is registered for the file's type."""
+
+
+class Context:
+    """What the stages of a pipeline hand on to each other.
+
+    Args:
+        file_path (str | Path): The portfolio file to read.
+        data_sources (List[IDataSource], optional): Market data sources for the portfolio, tried in order.
+        snapshots (SnapshotCache, optional): Where to load and save snapshots of the file. No snapshots without one.
+        **options: Passed on to the portfolio source, e.g. chunksize for CSV files.
+    """
+
+    def __init__(self, file_path, data_sources=None, snapshots=None, **options) -> None:
+        self.file_path = Path(file_path)
+        self.data_sources = list(data_sources or [])
+        self.snapshots = snapshots
+        self.options = options
+        self.source = None
+        self.positions = None
+        self.store = None
+        self.portfolio = None
+        self.metrics = None
+        self.services = {}
+        # Sources entered by a stage are exited (and write back) when the pipeline finishes.
+        self.exit_stack = ExitStack()
+
+    def register_service(self, name, service):
+        """Make something available to later stages and hooks by name."""
+        self.services[name] = service
+
+    def service(self, name):
+        if name not in self.services:
+            raise KeyError(f"No service registered as {name!r}. Registered: {', '.join(sorted(self.services))}.")
+        return self.services[name]
+
+
+def read(context: Context):
+    if context.snapshots:
+        store = context.snapshots.load(context.file_path)
+        if store is not None:
+            print(f"Loaded snapshot of {context.file_path}.")
+            context.store = store
+            return len(store)
+
+    suffix = context.file_path.suffix
+    options = {"chunksize": context.options.get("chunksize")} if suffix == '.csv' else {}
+    source = registry.portfolio_source(context.file_path, **options)
+    if source is None:
+        raise UnsupportedFileError(f"File type not supported: {suffix or context.file_path.name}")
+    print(f"Processing {suffix[1:]} file...")
+    context.source = context.exit_stack.enter_context(source)
+    return len(context.source.store)
+
+
+def munge(context: Context):
+    if context.source is not None:
+        context.positions = context.source.positions
+        context.store = context.source.store
+        # Snapshot before the source exits, so a file rewritten on exit simply invalidates it.
+        if context.snapshots and isinstance(context.store, TransactionStore):
+            context.snapshots.save(context.file_path, context.store)
+    return len(context.store)
+
+
+def repository(context: Context):
+    context.portfolio = Portfolio(data_sources=context.data_sources, positions=context.positions,
+                                  store=context.store, fetch_prices=False)
+    return len(context.portfolio.tickers())
+
+
+def prices(context: Context):
+    context.portfolio.get_latest_prices()
+    return len(context.portfolio.prices)
+
+
+def filter_positions(context: Context):
+    context.metrics = context.portfolio.metrics()
+    return len(context.metrics)
+
+
+def report(context: Context):
+    print_report(context.portfolio, context.metrics)
+
+
+def print_report(portfolio: Portfolio, rows=None):
+    """Print the portfolio summary and a section per position, from rows of Portfolio.metrics() if given."""
+    print(f"Portfolio Value: ${portfolio.get_value():.2f}")
+    print(f"Cost Basis: ${portfolio.cost_basis():.2f}")
+    print(f"Gain/Loss: ${portfolio.gain_loss():.2f}, ({portfolio.gain_loss_percent()*100:.4f}%)")
+    print(f"Average Time Held: {portfolio.average_time_held()}")
+    print(f"ARR: {portfolio.get_annualized_return()*100:.4f}%")
+    # Money-weighted returns need every transaction, which a streamed file does not keep.
+    xirr = None
+    if isinstance(portfolio.store, TransactionStore):
+        print(f"XIRR: {portfolio.get_xirr()*100:.4f}%")
+        xirr = portfolio.position_xirr()
+
+    # Same as above, but for each position. All positions are computed at once over the transaction store.
+    for position in (rows if rows is not None else portfolio.metrics()).itertuples():
+        print(f"{position.Index}, status: {position.status}")
+        print(f"\tValue: ${position.value:.2f}")
+        print(f"\tQuantity: {position.quantity}")
+        print(f"\tCost Basis: ${position.cost_basis:.2f}")
+        print(f"\tTotal Time Held: {position.time_held}")
+        print(f"\tPercent Return: {position.return_percent*100:.4f}%")
+        print(f"\tARR: {position.annualized_return*100:.4f}%")
+        if xirr is not None:
+            print(f"\tXIRR: {xirr[position.Index]*100:.4f}%")
+
+
+STAGES = {
+    "read": read,
+    "munge": munge,
+    "repository": repository,
+    "prices": prices,
+    "filter": filter_positions,
+    "report": report,
+}
+
+
+def _peak_rss():
+    """The most memory the process has held so far, in bytes, or None where the platform does not say."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Pipeline:
+    """Stages run in order over a Context, with hooks before and after each and a StageTiming recorded for each.
+
+    Args:
+        stages (Dict[str, Callable[[Context], int]], optional): The stages by name, in order. Each returns the number
+            of rows it produced, or None. Defaults to none; see Pipeline.default.
+        trace_memory (bool, optional): Measure memory with tracemalloc rather than the resident set size.
+    """
+
+    def __init__(self, stages: Dict[str, Callable] = None, trace_memory=False) -> None:
+        self.stages: Dict[str, Callable] = dict(stages or {})
+        self.trace_memory = trace_memory
+        self.hooks = {"before": defaultdict(list), "after": defaultdict(list)}
+        self.timings: List[StageTiming] = []
+
+    @classmethod
+    def default(cls, **kwargs):
+        """The pipeline the CLI runs: read, munge, repository, prices, filter and report."""
+        return cls(STAGES, **kwargs)
+
+    def stage(self, name, before=None):
+        """Decorator that adds a stage, or replaces the one of that name. New stages go last, or ahead of `before`."""
+        def register(function):
+            if name in self.stages or before is None:
+                self.stages[name] = function
+            else:
+                self._check(before)
+                stages = list(self.stages.items())
+                at = list(self.stages).index(before)
+                self.stages = dict(stages[:at] + [(name, function)] + stages[at:])
+            return function
+        return register
+
+    def before(self, stage):
+        """Decorator that registers a hook called with the context before a stage runs."""
+        return self._hook("before", stage)
+
+    def after(self, stage):
+        """Decorator that registers a hook called with the context after a stage has run."""
+        return self._hook("after", stage)
+
+    def _check(self, stage):
+        if stage not in self.stages:
+            raise KeyError(f"No stage named {stage!r}. Stages: {', '.join(self.stages)}.")
+
+    def _hook(self, when, stage):
+        self._check(stage)
+
+        def register(function):
+            self.hooks[when][stage].append(function)
+            return function
+        return register
+
+    def run(self, context: Context) -> Context:
+        """Run every stage over the context, then exit whatever sources the stages entered."""
+        self.timings = []
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            with context.exit_stack:
+                for name, function in self.stages.items():
+                    for hook in self.hooks["before"][name]:
+                        hook(context)
+                    self.timings.append(self._measure(name, function, context))
+                    for hook in self.hooks["after"][name]:
+                        hook(context)
+        finally:
+            if tracing:
+                tracemalloc.stop()
+        return context
+
+    def _measure(self, name, function, context) -> StageTiming:
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        rows = function(context)
+        seconds = time.perf_counter() - started
+        metrics.observe("pipeline.stage", seconds, stage=name)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            return StageTiming(name, seconds, rows, current - start, peak - start)
+        return StageTiming(name, seconds, rows, None, _peak_rss())
+
+
+def _mib(size):
+    return "" if size is None else f"{size / 2 ** 20:,.1f} MiB"
+
+
+def print_timings(timings: List[StageTiming]):
+    """Print a table of the time, rows and memory of every stage."""
+    print(f"{'Stage':<12}{'Seconds':>10}{'Rows':>12}{'Allocated':>14}{'Peak':>14}")
+    for timing in timings:
+        rows = "" if timing.rows is None else f"{timing.rows:,}"
+        print(f"{timing.stage:<12}{timing.seconds:>10.3f}{rows:>12}{_mib(timing.allocated):>14}{_mib(timing.peak):>14}")
+    print(f"{'total':<12}{sum(timing.seconds for timing in timings):>10.3f}")
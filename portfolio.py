@@ -1,106 +1,275 @@
 from datetime import datetime
 from typing import List, Dict
 
-from multimethod import multimethod
-from pandas import Timedelta
+import numpy as np
+import pandas as pd
 
+import metrics
+import returns
 from DataSources import IDataSource
-from position import Position
+from DataSources.router import SourceRouter
+from lots import LotBook
+from position import Position, Status
+from transaction_store import TransactionStore
+
+
+AGGREGATES = ["quantity", "cost_basis", "buy_amount", "first_date", "last_date", "transactions"]
+DERIVED = ["market_value", "value", "return", "return_percent"]
 
 
 class Portfolio:
-    """A collection of positions segregated by security. In most cases this means a stock ticker."""
+    """A collection of positions segregated by security. In most cases this means a stock ticker.
+
+    Portfolio wide metrics are computed over a columnar TransactionStore rather than position by position. The store is
+    built from the positions, or can be passed in directly; a portfolio made from a store alone needs no Position
+    objects at all.
 
-    def __init__(self, data_sources: List[IDataSource] = None, positions: List[Position] = None):
-        self._gain_loss_date = None
-        self._gain_loss = None
-        self._cost_basis_date = None
-        self._cost_basis = None
+    Per-ticker metrics are cached as columns, one row per ticker, and each row remembers the revisions it was computed
+    from: the position's revision and price_revision, the store's revision, and the revision of the ticker's entry in
+    `prices`. A row is recomputed only once one of those has moved, so a price tick costs a handful of rows rather than
+    the whole portfolio, and nothing is ever served stale.
+    """
+
+    def __init__(self, data_sources: List[IDataSource] = None, positions: List[Position] = None, hedge_after=None,
+                 store: TransactionStore = None, fetch_prices=True):
         self._last_price_update = None
+        self.prices: Dict[str, float] = {}
+        self._price_revisions: Dict[str, int] = {}
         self.positions = {}
+        # A store passed in already holds the transactions of the positions passed with it.
+        self._store = None
+        self._store_owned = store is None
+        self._store_version = None
+        # The row cache behind the metrics; see _sync.
+        self._slots: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._seen_store = None
+        self._transactions_version = 0
+        self._reset_rows([])
         self.append(positions or {})
-        self._data_sources = data_sources
+        self._store = store
+        self._data_sources = data_sources or []
+        # Sources are tried in order; a failing source is skipped by its circuit breaker. With hedge_after set, the
+        # next source is also asked when one has not answered within that many seconds.
+        self._router = SourceRouter(self._data_sources, hedge_after=hedge_after)
 
-        # Get latest prices from sources for all positions and cache for 24 hours.
-        self.get_latest_prices()
+        # Get latest prices from sources for all positions, unless the caller will (see pipeline.prices).
+        if fetch_prices:
+            self.get_latest_prices()
 
     def append(self, positions: Dict[str, Position]):
         """Add a list of positions to the portfolio."""
+        merged = 0
         for ticker, position in positions.items():
-            print(f"Adding position {position} to portfolio...")
             if position.ticker in self.positions:
-                print(f"Position {position} already exists in portfolio. Merging...")
-                self.positions[position.ticker].merge_position(position.transactions)
+                self.positions[position.ticker].merge_position(position)
+                merged += 1
             else:
-                print(f"Position {position} does not exist in portfolio. Adding...")
                 self.positions[position.ticker] = position
+        metrics.increment("portfolio.positions_added", len(positions) - merged)
+        metrics.increment("portfolio.positions_merged", merged)
+
+        if self._store is not None and not self._store_owned:
+            self._store.extend_positions(positions.values())
+
+    @property
+    def store(self) -> TransactionStore:
+        """Every transaction in the portfolio as columns.
+
+        A store built from the positions is rebuilt whenever any of them changed. A store passed in is kept in step by
+        append and otherwise trusted as is.
+        """
+        if self._store_owned:
+            self._sync()
+            if self._store is None or self._store_version != self._transactions_version:
+                self._store = TransactionStore.from_positions(self.positions)
+                self._store_version = self._transactions_version
+        return self._store
+
+    def tickers(self):
+        """Every ticker held, whether as a Position or only in the store."""
+        tickers = list(self.positions)
+        if self._store is not None:
+            tickers.extend(self._store.tickers())
+        return list(dict.fromkeys(tickers))
+
+    def _reset_rows(self, tickers):
+        """Lay the row cache out for these tickers, carrying over the rows of tickers it already had."""
+        old_slots, old_columns = self._slots, self._columns
+        keep = np.array([old_slots.get(ticker, -1) for ticker in tickers], dtype=np.int64)
+        found = keep >= 0
+
+        def column(name, dtype, fill):
+            values = np.full(len(tickers), fill, dtype=dtype)
+            if name in old_columns:
+                values[found] = old_columns[name][keep[found]]
+            return values
+
+        self._slots = {ticker: slot for slot, ticker in enumerate(tickers)}
+        self._columns = {name: column(name, np.float64, np.nan) for name in ["quantity", "cost_basis", "buy_amount",
+                                                                             *DERIVED]}
+        self._columns["first_date"] = column("first_date", "datetime64[ns]", np.datetime64("NaT"))
+        self._columns["last_date"] = column("last_date", "datetime64[ns]", np.datetime64("NaT"))
+        self._columns["transactions"] = column("transactions", np.int64, 0)
+        # What each row was last computed from: the position's (revision, price_revision), and the revision of the
+        # ticker's entry in `prices`, or -1 for a row that needs recomputing regardless.
+        self._columns["seen_position"] = column("seen_position", object, None)
+        self._columns["seen_price"] = column("seen_price", np.int64, -1)
+        self._seen_store = None
+        self._transactions_version += 1
+
+    def _sync(self):
+        """Bring the row cache up to date, recomputing only the rows whose inputs changed since the last call."""
+        if self._store_owned:
+            if self.positions.keys() != self._slots.keys():
+                self._reset_rows(list(self.positions))
+        elif self._seen_store != self._store.revision:
+            aggregates = self._store.aggregate()
+            if list(aggregates.index) != list(self._slots):
+                self._reset_rows(list(aggregates.index))
+            # Only rows whose totals actually moved count as changed.
+            changed = np.zeros(len(self._slots), dtype=bool)
+            for name in AGGREGATES:
+                new = aggregates[name].to_numpy().astype(self._columns[name].dtype)
+                changed |= ~((new == self._columns[name]) | (pd.isna(new) & pd.isna(self._columns[name])))
+                self._columns[name] = new
+            self._columns["seen_price"][changed] = -1
+            self._seen_store = self._store.revision
+        columns = self._columns
+
+        seen_position, seen_price = columns["seen_position"], columns["seen_price"]
+        stale = seen_price < 0
+        for ticker, position in self.positions.items():
+            slot = self._slots.get(ticker)
+            if slot is None:
+                continue
+            previous = seen_position[slot]
+            if previous == (position.revision, position.price_revision):
+                continue
+            if self._store_owned and (previous is None or previous[0] != position.revision):
+                for name, value in zip(AGGREGATES, position.totals()):
+                    columns[name][slot] = np.datetime64(value, "ns") if name.endswith("date") else value
+                self._transactions_version += 1
+            seen_position[slot] = (position.revision, position.price_revision)
+            stale[slot] = True
+        for ticker, revision in self._price_revisions.items():
+            slot = self._slots.get(ticker)
+            if slot is not None and seen_price[slot] != revision:
+                stale[slot] = True
+
+        rows = np.flatnonzero(stale)
+        if len(rows):
+            self._compute(rows)
+
+    def _compute(self, rows):
+        """Recompute the price dependent columns of some rows."""
+        columns = self._columns
+        tickers = list(self._slots)
+        market_value = np.array([self._market_value(tickers[row]) for row in rows], dtype=np.float64)
+        quantity = columns["quantity"][rows]
+        cost_basis = columns["cost_basis"][rows]
+        is_open = quantity > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value = np.where(is_open, quantity * market_value, 0.0)
+            gain = np.where(is_open, value - cost_basis, cost_basis)
+            columns["market_value"][rows] = market_value
+            columns["value"][rows] = value
+            columns["return"][rows] = gain
+            columns["return_percent"][rows] = np.where(is_open, gain / cost_basis,
+                                                       cost_basis / columns["buy_amount"][rows])
+        columns["seen_price"][rows] = [self._price_revisions.get(tickers[row], 0) for row in rows]
+
+    def _market_value(self, ticker):
+        position = self.positions.get(ticker)
+        if position is not None and position.market_value is not None:
+            return position.market_value
+        return self.prices.get(ticker, np.nan)
+
+    def metrics(self, now=None) -> pd.DataFrame:
+        """Per-position metrics for every position, computed column-wise in one pass over the store.
+
+        Returns:
+            pd.DataFrame: Indexed by ticker. The aggregate columns of TransactionStore.aggregate, plus status,
+            market_value, value, return, return_percent, time_held and annualized_return, which match the Position
+            getters of the same names.
+        """
+        self._sync()
+        now = np.datetime64(now or datetime.now(), "ns")
+        frame = pd.DataFrame({name: self._columns[name].copy() for name in AGGREGATES},
+                             index=pd.Index(list(self._slots), name="Ticker"))
+        is_open = frame["quantity"].to_numpy() > 0
+        first_date = frame["first_date"].to_numpy()
+
+        # Only the time held depends on the clock, so it is the one part computed on every call.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            time_held = pd.to_timedelta(np.where(is_open, now - first_date, frame["last_date"].to_numpy() - first_date))
+            frame["status"] = np.where(is_open, Status.OPEN, Status.CLOSED)
+            for name in DERIVED:
+                frame[name] = self._columns[name].copy()
+            frame["time_held"] = time_held
+            frame["annualized_return"] = frame["return_percent"].to_numpy() / time_held.days.to_numpy() * 365
+        return frame
+
+    def market_values(self) -> pd.Series:
+        """The market value of every ticker, NaN where there is none yet."""
+        self._sync()
+        return pd.Series(self._columns["market_value"], index=pd.Index(list(self._slots), name="Ticker"))
+
+    def position_xirr(self, now=None) -> pd.Series:
+        """Money-weighted annual return (XIRR) of every position, indexed by ticker. See returns.position_xirr."""
+        return returns.position_xirr(self.store, self.market_values(), now)
+
+    def get_xirr(self, now=None):
+        """Money-weighted annual return (XIRR) of the portfolio as a whole, counting every lot bought and sold."""
+        return returns.portfolio_xirr(self.store, self.market_values(), now)
+
+    def lots(self, policy="fifo", **kwargs) -> LotBook:
+        """Match every sell to the lots it closes under a policy (fifo, lifo, hifo or specific). See lots.LotBook."""
+        return LotBook.from_store(self.store, policy, **kwargs)
 
     def get_value(self):
         """Get the total value of the portfolio."""
-        total = 0
-        for ticker, position in self.positions.items():
-            total += position.get_value()
-        return total
+        self._sync()
+        return float(np.nansum(self._columns["value"]))
+
+    def get_latest_prices(self, cache_time=None):
+        """Get the latest prices for all positions.
 
-    def get_latest_prices(self, cache_time=Timedelta(24 * 60 * 60)):
-        """Get the latest prices for all positions."""
-        if self._last_price_update and datetime.now() < self._last_price_update + cache_time:
+        With a cache_time, prices fetched less than that long ago are kept rather than asked for again.
+        """
+        if cache_time and self._last_price_update and datetime.now() < self._last_price_update + cache_time:
             return
 
-        for ticker, position in self.positions.items():
-            for source in self._data_sources:
-                # try each source until we get a price
-                try:
-                    market_value = source.download_ticker_data(position.ticker)
-                    self.positions[position.ticker].market_value = market_value['Close'].iloc[-1]
-                    break
-                except Exception as e:
-                    raise e
+        # try each source until we get a price; tickers no source can price keep their last known value
+        self.update_prices(self._router.get_latest_prices(self.tickers()))
 
         self._last_price_update = datetime.now()
 
+    def update_prices(self, prices: Dict[str, float]):
+        """Set the latest price of some tickers, e.g. as they arrive from a live feed. Other tickers are untouched."""
+        for ticker, price in prices.items():
+            if self.prices.get(ticker) != price:
+                self.prices[ticker] = price
+                self._price_revisions[ticker] = self._price_revisions.get(ticker, 0) + 1
+            if ticker in self.positions:
+                self.positions[ticker].market_value = price
+
     def cost_basis(self):
         """Get the cost basis of the portfolio."""
-        # Cache the cost basis for 24 hours.
-        if self._cost_basis_date and datetime.now() < self._cost_basis_date + Timedelta(24 * 60 * 60):
-            return self._cost_basis
-
-        self._cost_basis_date = datetime.now()
-
-        total = 0
-        for ticker, position in self.positions.items():
-            total += position.get_cost_basis()
-
-        self._cost_basis = total
-
-        return total
+        self._sync()
+        return float(self._columns["cost_basis"].sum())
 
     def gain_loss(self):
         """Get the gain or loss of the portfolio."""
-        # Update prices and cost basis if stale.
-        if (self._gain_loss is None or
-                self._last_price_update and datetime.now() > self._last_price_update + Timedelta(24 * 60 * 60)):
-            self.get_latest_prices()
-            self.cost_basis()
-            self._gain_loss = self.get_value() - self.cost_basis()
-            self._gain_loss_date = datetime.now()
-
-        return self._gain_loss
+        return self.get_value() - self.cost_basis()
 
     def gain_loss_percent(self):
         """Get the gain or loss of the portfolio as a percentage."""
-        # Update prices and cost basis if stale.
-        if self._last_price_update and datetime.now() > self._last_price_update + Timedelta(24 * 60 * 60):
-            self._gain_loss = self.get_value() - self.cost_basis()
-
-        return self._gain_loss / self._cost_basis
+        return self.gain_loss() / self.cost_basis()
 
     def average_time_held(self):
         """Get the average time held of the portfolio."""
-        total = Timedelta(0)
-        for ticker, position in self.positions.items():
-            total += position.get_time_held()
-        return total / len(self.positions)
+        return self.metrics()["time_held"].mean()
 
     def get_annualized_return(self):
         """Get the annualized rate of return of the portfolio."""
@@ -1,62 +1,57 @@
 import pandas as pd
-import yfinance as yf
 import click
 from datetime import datetime
-import time
-from random import random
-from talib import ATR
-import prettytable
+from functools import partial
 
+from registry import lazy_import
 
-def download_ticker_data(ticker, period="1d", max_retries=5, base_delay=1, jitter=0.1):
-    """Downloads historical data for a single ticker with exponential backoff."""
-    for attempt in range(max_retries):
-        try:
-            return yf.download(ticker, period=period, auto_adjust=True)
-        except Exception as e:
-            delay = (2 ** attempt + random() * jitter) * base_delay
-            print(f"Error downloading {ticker}: {e}. Retrying in {delay:.2f} seconds...")
-            time.sleep(delay)
-    print(f"Failed to download data for {ticker} after {max_retries} attempts.")
-    return None
+from DataSources.fetch import get_scheduler
+from DataSources.store import CachedDataSource
+from DataSources.yahoo import Yahoo
+from indicators import STOP_COLUMNS, TrailingStops, calculate_atr
+
+# Loaded on first use, so importing this module stays cheap.
+yf = lazy_import("yfinance")
 
 
 def download_historical_data(tickers, period="1d", max_retries=5, base_delay=1, jitter=0.1):
-    """Downloads historical data for a list of tickers with exponential backoff."""
-    data = {}
-    for ticker in set(tickers):
-        data[ticker] = download_ticker_data(ticker, period, max_retries, base_delay, jitter)
-    return data
+    """Downloads historical data for a list of tickers concurrently, retrying each with exponential backoff."""
+    scheduler = get_scheduler()
+    scheduler.configure(yf, max_concurrency=4, requests_per_second=2)
+    return scheduler.map(yf, partial(yf.download, period=period, auto_adjust=True), set(tickers),
+                         max_retries, base_delay, jitter)
 
 
 def calculate_atr_values(ohlcv_dict, period=14):
-    """Calculates ATR and related values for each ticker in a dictionary of OHLCV data."""
-    for ticker, ticker_data in ohlcv_dict.items():
-        if ticker_data is not None and len(ticker_data) >= period:
-            high = ticker_data['High']
-            low = ticker_data['Low']
+    """Calculates ATR and related values for each ticker in a dictionary of OHLCV data.
+
+    Every ticker is computed in one stacked pass; see indicators.trailing_stops for just the latest values.
+    """
+    for ticker, atr in calculate_atr(ohlcv_dict, period=period).items():
+        ticker_data = ohlcv_dict[ticker]
+        if len(ticker_data) >= period:
             close = ticker_data['Close']
-            atr = ATR(high, low, close, timeperiod=period)
             ticker_data['ATR'] = atr
             ticker_data['Close_Minus_ATR_15'] = close - atr * 1.5
             ticker_data['Close_Plus_ATR_3'] = close + atr * 3
     return ohlcv_dict
 
 
-def process_csv(csv_file):
-    """Processes the portfolio CSV file and returns enriched data."""
+def process_csv(csv_file, source=None):
+    """Processes the portfolio CSV file and returns enriched data.
+
+    History comes from the local bar store, and ATR state from the indicator store, so only bars newer than the last
+    run are downloaded and nothing is recomputed.
+    """
+    source = source or CachedDataSource(Yahoo())
     df = pd.read_csv(csv_file)
     df['Date'] = pd.to_datetime(df['Date'])
     df['Timedelta'] = (datetime.now() - df['Date']).dt.days
     tickers = df['Ticker'].tolist()
-    latest_data = download_historical_data(tickers, period="15d")
-    latest_data = calculate_atr_values(latest_data, period=14)
-    for ticker, ticker_data in latest_data.items():
-        if ticker_data is not None:
-            df.loc[df['Ticker'] == ticker, 'Latest Price'] = ticker_data.iloc[-1]['Close']
-            df.loc[df['Ticker'] == ticker, 'ATR'] = ticker_data.iloc[-1]['ATR']
-            df.loc[df['Ticker'] == ticker, 'Close_Minus_ATR_15'] = ticker_data.iloc[-1]['Close_Minus_ATR_15']
-            df.loc[df['Ticker'] == ticker, 'Close_Plus_ATR_3'] = ticker_data.iloc[-1]['Close_Plus_ATR_3']
+    # Stops are folded forward from the stored indicator state, so only bars since the last run are downloaded. One
+    # merge then brings the latest price and stops of every ticker in, rather than masked assignments per ticker.
+    stops = TrailingStops(source, period=14).refresh(tickers)
+    df = df.drop(columns=STOP_COLUMNS, errors='ignore').merge(stops, how='left', left_on='Ticker', right_index=True)
     df['Market Value'] = df['Quantity'] * df['Latest Price']
     df['Total Gain/Loss ($)'] = df['Market Value'] - df['Cost Basis']
     df['Total Gain/Loss (%)'] = (df['Market Value'] - df['Cost Basis']) / df['Cost Basis']
@@ -14,7 +14,19 @@ class Status(Enum):
 
 
 class Position:
-    """A class to represent a position in a portfolio."""
+    """A class to represent a position in a portfolio.
+
+    Running totals (quantity, cost basis, amount bought, first and last date) are kept up to date as transactions are
+    added, so adding a transaction and every getter are O(1). Code that edits `transactions` in place must call
+    recompute() afterwards.
+
+    For write-back, the first `persisted` transactions are the ones already saved by the portfolio source; anything
+    after them was appended since. `dirty` is set when saved transactions were edited, which needs a full rewrite.
+    Transactions themselves are never modified in place, so this is all the tracking they need.
+
+    `revision` goes up whenever the transactions change and `price_revision` whenever the market value does, so
+    anything derived from a position (Portfolio's metrics, say) can tell whether it is still current.
+    """
 
     def __init__(self, ticker, transactions: List[Transaction] = None, market_value=None):
         self.status = None
@@ -26,28 +38,88 @@ class Position:
         else:
             self.transactions = []
 
-        self.market_value = market_value
-        self.set_status()  # Call set_status to initialize
+        self.revision = 0
+        self.price_revision = 0
+        self._market_value = market_value
+        self.persisted = 0
+        self.dirty = False
+        self._rebuild()
+
+    def recompute(self):
+        """Rebuild the running totals after `transactions` was edited in place."""
+        self._rebuild()
+        self.dirty = True
+        self.revision += 1
+
+    def new_transactions(self) -> List[Transaction]:
+        """Transactions appended since the position was last saved."""
+        return self.transactions[self.persisted:]
+
+    def mark_persisted(self):
+        """Record that every transaction has been saved."""
+        self.persisted = len(self.transactions)
+        self.dirty = False
+
+    @property
+    def market_value(self):
+        return self._market_value
+
+    @market_value.setter
+    def market_value(self, market_value):
+        if market_value != self._market_value:
+            self._market_value = market_value
+            self.price_revision += 1
+
+    def _rebuild(self):
+        self._quantity = 0
+        self._cost_basis = 0
+        self._buy_amount = 0
+        self._first_date = None
+        self._last_date = None
+        for transaction in self.transactions:
+            self._apply(transaction)
+        self.set_status()
+
+    def _apply(self, transaction):
+        """Fold one transaction into the running totals."""
+        self._quantity += transaction.quantity
+        # We expect credits to be positive quantities or prices, and debits to be negative quantities or prices.
+        self._cost_basis += transaction.price * transaction.quantity
+        if transaction.action == Action.BUY:
+            self._buy_amount += transaction.amount
+        if self._first_date is None or transaction.date < self._first_date:
+            self._first_date = transaction.date
+        if self._last_date is None or transaction.date > self._last_date:
+            self._last_date = transaction.date
 
     def set_status(self):
-        """Updates the status and quantity based on the transactions."""
-        total_quantity = sum(transaction.quantity for transaction in self.transactions)
-        self.status = Status.OPEN if total_quantity > 0 else Status.CLOSED
+        """Updates the status based on the running quantity."""
+        self.status = Status.OPEN if self._quantity > 0 else Status.CLOSED
 
     def add_transaction(self, transaction):
         """Add a transaction to the position."""
         # print(f"Adding transaction {transaction} to position {self}")
         self.transactions.append(transaction)
+        self._apply(transaction)
         self.set_status()  # Update status after adding transaction
+        self.revision += 1
 
     def merge_position(self, position):
         """Merge a position into this position."""
         self.transactions.extend(position.transactions)
+        for transaction in position.transactions:
+            self._apply(transaction)
         self.set_status()  # Update status after merging
+        self.revision += 1
 
     def get_quantity(self):
         """Get the quantity of securities held in the position."""
-        return sum(transaction.quantity for transaction in self.transactions)
+        return self._quantity
+
+    def totals(self):
+        """The running totals, in the column order of TransactionStore.aggregate."""
+        return (self._quantity, self._cost_basis, self._buy_amount, self._first_date, self._last_date,
+                len(self.transactions))
 
     def get_value(self):
         """Get the value of the position."""
@@ -65,22 +137,16 @@ class Position:
     def get_time_held(self, date=None):
         """Get the time held for the position."""
         if self.get_status() == Status.CLOSED:
-            # Ensure the transactions are sorted by date
-            sorted_transactions = sorted(self.transactions, key=lambda txn: txn.date)
-            return sorted_transactions[-1].date - sorted_transactions[0].date
+            return self._last_date - self._first_date
 
         if not date:
             date = datetime.now()
 
-        return date - self.transactions[0].date
+        return date - self._first_date
 
     def get_cost_basis(self):
         """Get the cost basis of the position."""
-        cost_basis = 0
-        for transaction in self.transactions:
-            # We expect credits to be positive quantities or prices, and debits to be negative quantities or prices.
-            cost_basis = cost_basis + transaction.price * transaction.quantity
-        return cost_basis
+        return self._cost_basis
 
     def get_return(self):
         """Get return of the position."""
@@ -94,7 +160,7 @@ class Position:
         """Get return of the position in %."""
         if self.get_status() == Status.CLOSED:
             # If the position is closed, the return percent is cost_basis divided by all the buy transactions.
-            return self.get_cost_basis() / sum([txn.amount for txn in self.transactions if txn.action == Action.BUY])
+            return self.get_cost_basis() / self._buy_amount
         return self.get_return() / self.get_cost_basis()
 
     def get_annualized_return(self):
@@ -0,0 +1,74 @@
+"""registry.py - Plugin registry for data sources and portfolio sources.
+
+Implementations are registered by name as "module:Class" strings and only imported when first asked for, so starting
+the CLI does not pay for pandas, yfinance or ccxt until a source that needs them is actually used. Third party sources
+register themselves the same way:
+
+    register_data_source("mybroker", "mypackage.broker:BrokerSource")
+    register_portfolio_source(".ofx", "mypackage.ofx:OfxPortfolioSource")
+"""
+import importlib
+import importlib.util
+import sys
+from pathlib import Path
+
+DATA_SOURCES = {
+    "yahoo": "DataSources.yahoo:Yahoo",
+    "kraken": "DataSources.kraken:Kraken",
+    "router": "DataSources.router:SourceRouter",
+    "cached": "DataSources.store:CachedDataSource",
+    "mock": "DataSources.mock:MockDataSource",
+}
+
+# Keyed by file suffix.
+PORTFOLIO_SOURCES = {
+    ".csv": "PortfolioSources.csv:CsvPortfolioSource",
+    ".ledger": "PortfolioSources.ledgercli:LedgerPortfolioSource",
+}
+
+
+def lazy_import(name):
+    """A module that is only actually imported when one of its attributes is first used.
+
+    Raises ImportError straight away if the module is not installed at all.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(target: str):
+    """Import the object named by a "module:attribute" string."""
+    module, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def register_data_source(name, target):
+    DATA_SOURCES[name] = target
+
+
+def register_portfolio_source(suffix, target):
+    PORTFOLIO_SOURCES[suffix] = target
+
+
+def data_source(name, *args, **kwargs):
+    """Create the data source registered under `name`."""
+    if name not in DATA_SOURCES:
+        raise KeyError(f"Unknown data source {name!r}. Known sources: {', '.join(sorted(DATA_SOURCES))}.")
+    return load(DATA_SOURCES[name])(*args, **kwargs)
+
+
+def portfolio_source(file_path, **kwargs):
+    """Create the portfolio source registered for the file's suffix, or return None if there is none."""
+    target = PORTFOLIO_SOURCES.get(Path(file_path).suffix)
+    if target is None:
+        return None
+    return load(target)(file_path, **kwargs)
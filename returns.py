@@ -0,0 +1,164 @@
+"""returns.py - Money-weighted (XIRR) and time-weighted returns.
+
+XIRR is solved for many cash flow series at once. All flows sit in flat arrays tagged with the series they belong to,
+so the net present value of every series, and its derivative, is a single weighted bincount. Newton's method moves
+every series at once; series it cannot settle (no sign change near the guess, a flat derivative) are bracketed on a
+grid of rates and finished by bisection, again all together.
+
+Cash flows follow the investor: buying costs money (a negative flow), selling returns it, and whatever is still held
+counts as sold at its market value on the valuation date.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from transaction_store import TransactionStore
+
+DAYS_PER_YEAR = 365.0
+# Rates tried when bracketing a root for bisection.
+BRACKET_RATES = np.array([-0.9999, -0.99, -0.9, -0.5, -0.2, 0.0, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 100.0, 1e4, 1e6])
+
+
+def _npv(rates, amounts, years, groups, n):
+    """Net present value of every series at its rate, and its derivative with respect to the rate."""
+    growth = 1.0 + rates[groups]
+    discounted = amounts * growth ** -years
+    npv = np.bincount(groups, weights=discounted, minlength=n)
+    derivative = np.bincount(groups, weights=-years * discounted / growth, minlength=n)
+    return npv, derivative
+
+
+def xirr(amounts, dates, groups, n=None, guess=0.1, tol=1e-9, max_iter=50) -> np.ndarray:
+    """Annual internal rate of return of many cash flow series at once.
+
+    Args:
+        amounts (np.ndarray): Every cash flow; negative for money paid in.
+        dates (np.ndarray): The datetime64 date of each flow.
+        groups (np.ndarray): The series (0 to n - 1) each flow belongs to.
+        n (int, optional): The number of series. Defaults to the largest group plus one.
+
+    Returns:
+        np.ndarray: The rate of each series, NaN where there is none (all flows of one sign, say).
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    n = int(groups.max()) + 1 if n is None else n
+    if n == 0:
+        return np.empty(0)
+
+    # Time is measured from each series' first flow, so long histories do not overflow the discount factor.
+    days = np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    first = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(first, groups, days)
+    years = (days - first[groups]) / DAYS_PER_YEAR
+
+    paid = np.bincount(groups, weights=np.where(amounts < 0, 1.0, 0.0), minlength=n) > 0
+    received = np.bincount(groups, weights=np.where(amounts > 0, 1.0, 0.0), minlength=n) > 0
+    solvable = paid & received
+
+    rates = np.full(n, guess)
+    converged = ~solvable
+    for _ in range(max_iter):
+        active = ~converged
+        if not active.any():
+            break
+        npv, derivative = _npv(rates, amounts, years, groups, n)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            step = np.where(active, npv / derivative, 0.0)
+        stepped = rates - step
+        # Stay above -100%, where the discount factor is undefined.
+        stepped = np.where(stepped <= -1.0, (rates - 1.0) / 2.0, stepped)
+        good = np.isfinite(stepped)
+        rates = np.where(active & good, stepped, rates)
+        converged |= active & good & (np.abs(step) <= tol * np.maximum(1.0, np.abs(rates)))
+        converged |= active & ~good
+
+    # A root should leave an NPV that is small next to the (discounted) flows it nets out.
+    npv, _ = _npv(rates, amounts, years, groups, n)
+    with np.errstate(over="ignore", invalid="ignore"):
+        scale = _npv(rates, np.abs(amounts), years, groups, n)[0]
+    settled = solvable & np.isfinite(rates) & (np.abs(npv) <= 1e-6 * scale)
+    unsettled = solvable & ~settled
+    if unsettled.any():
+        rates[unsettled] = _bisect(amounts, years, groups, n, unsettled, tol)[unsettled]
+    rates[~solvable] = np.nan
+    return rates
+
+
+def _bisect(amounts, years, groups, n, mask, tol, max_iter=200):
+    """Rates of the masked series by bisection, from the first sign change of the NPV along BRACKET_RATES."""
+    values = np.stack([_npv(np.full(n, rate), amounts, years, groups, n)[0] for rate in BRACKET_RATES])
+    change = np.sign(values[:-1]) * np.sign(values[1:]) <= 0
+    found = change.any(axis=0) & mask
+    first = np.argmax(change, axis=0)
+    lo, hi = BRACKET_RATES[first], BRACKET_RATES[first + 1]
+    lo_npv = values[first, np.arange(n)]
+
+    for _ in range(max_iter):
+        mid = (lo + hi) / 2.0
+        mid_npv = _npv(mid, amounts, years, groups, n)[0]
+        left = np.sign(mid_npv) == np.sign(lo_npv)
+        lo = np.where(left, mid, lo)
+        lo_npv = np.where(left, mid_npv, lo_npv)
+        hi = np.where(left, hi, mid)
+        if np.all((hi - lo)[found] <= tol * np.maximum(1.0, np.abs(lo[found]))):
+            break
+    return np.where(found, (lo + hi) / 2.0, np.nan)
+
+
+def _flows(store: TransactionStore, market_values: pd.Series, now):
+    """The investor's cash flows per ticker code: every transaction, plus the value of open holdings at `now`."""
+    if not isinstance(store, TransactionStore):
+        raise TypeError("Money-weighted returns need the transactions themselves, not just per-ticker totals.")
+    aggregates = store.aggregate()
+    quantity = aggregates["quantity"].to_numpy()
+    market_value = market_values.reindex(aggregates.index).to_numpy(dtype=np.float64)
+    held = quantity > 0
+    codes = np.flatnonzero(held)
+
+    amounts = np.concatenate([-store.prices * store.quantities, quantity[held] * market_value[held]])
+    dates = np.concatenate([store.dates, np.full(len(codes), np.datetime64(now, "ns"))])
+    groups = np.concatenate([store.codes, codes])
+    return amounts, dates, groups, aggregates.index
+
+
+def position_xirr(store: TransactionStore, market_values: pd.Series, now=None) -> pd.Series:
+    """XIRR of every position, indexed by ticker. Open positions without a market value come out NaN."""
+    amounts, dates, groups, tickers = _flows(store, market_values, now or datetime.now())
+    return pd.Series(xirr(amounts, dates, groups, len(tickers)), index=tickers, name="xirr")
+
+
+def portfolio_xirr(store: TransactionStore, market_values: pd.Series, now=None) -> float:
+    """XIRR of the whole portfolio, taking every position's flows together.
+
+    Open positions without a market value are left out altogether, rather than counted as worthless.
+    """
+    amounts, dates, groups, tickers = _flows(store, market_values, now or datetime.now())
+    priced = ~np.isnan(amounts)
+    unpriced = np.unique(groups[~priced])
+    keep = priced & ~np.isin(groups, unpriced)
+    return float(xirr(amounts[keep], dates[keep], np.zeros(keep.sum(), dtype=np.int64), 1)[0])
+
+
+def twr_series(history: pd.DataFrame) -> pd.Series:
+    """Cumulative time-weighted return by date, from a valuation.value_history frame.
+
+    Money put in or taken out (the change in cost basis) is taken as arriving at the start of the day it lands on, so
+    each day's return is its closing value over the previous close plus that day's flow.
+    """
+    value = history["value"].to_numpy()
+    flows = np.diff(history["cost_basis"].to_numpy(), prepend=0.0)
+    start = np.concatenate([[0.0], value[:-1]]) + flows
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily = np.where(start > 0, value / start, 1.0)
+    return pd.Series(np.cumprod(daily) - 1.0, index=history.index, name="twr")
+
+
+def twr(history: pd.DataFrame, annualize=False) -> float:
+    """Time-weighted return over a valuation.value_history frame, optionally per year."""
+    total = float(twr_series(history).iloc[-1]) if len(history) else np.nan
+    if not annualize:
+        return total
+    years = (history.index[-1] - history.index[0]).days / DAYS_PER_YEAR
+    return (1.0 + total) ** (1.0 / years) - 1.0 if years > 0 else np.nan
@@ -1,4 +1,5 @@
 """transaction,py - A class to represent a single transaction for a single security."""
+import sys
 from datetime import datetime
 from enum import Enum
 
@@ -9,19 +10,40 @@ class Action(Enum):
 
 
 class Transaction:
-    """A class to represent a single transaction for a single security."""
+    """A class to represent a single transaction for a single security.
+
+    Transactions are immutable values: setting an attribute raises AttributeError, and two with the same ticker, date,
+    price, quantity, action and account are equal and hash alike. They are slotted, and tickers are interned, so a
+    book of millions costs one small object per row and one string per ticker.
+    """
+
+    __slots__ = ("ticker", "date", "price", "quantity", "amount", "action", "account")
 
     def __init__(self, ticker, date, price, quantity, action=None, account=None):
         # TODO wire in account, will be used for double entry accounting
-        self.ticker = ticker
-        self.date = date
-        self.price = price
-        self.quantity = quantity
-        self.amount = price * quantity
-        if action:
-            self.action = action
-        else:
-            self.action = Action.BUY if quantity > 0 else Action.SELL
+        if not action:
+            action = Action.BUY if quantity > 0 else Action.SELL
+        # Attributes can only be set here, through the slots themselves, past the __setattr__ that refuses them.
+        set_ticker, set_date, set_price, set_quantity, set_amount, set_action, set_account = _SLOT_SETTERS
+        set_ticker(self, sys.intern(ticker) if type(ticker) is str else ticker)
+        set_date(self, date)
+        set_price(self, price)
+        set_quantity(self, quantity)
+        set_amount(self, price * quantity)
+        set_action(self, action)
+        set_account(self, account)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Transaction is immutable; cannot set {name!r}.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Transaction is immutable; cannot delete {name!r}.")
+
+    def __reduce__(self):
+        return Transaction, (self.ticker, self.date, self.price, self.quantity, self.action, self.account)
+
+    def _key(self):
+        return self.ticker, self.date, self.price, self.quantity, self.action, self.account
 
     def __str__(self):
         return f"Transaction({self.ticker}, {self.date}, {self.price}, {self.quantity})"
@@ -30,7 +52,12 @@ class Transaction:
         return str(self)
 
     def __hash__(self):
-        return hash((self.date, self.price, self.quantity))
+        return hash(self._key())
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return self._key() == other._key()
+
+
+_SLOT_SETTERS = tuple(getattr(Transaction, name).__set__ for name in Transaction.__slots__)
@@ -0,0 +1,170 @@
+"""transaction_store.py - Columnar storage for the transactions of many positions.
+
+Instead of one Transaction object per row, the store keeps parallel NumPy arrays of ticker code, date, price and
+quantity. Per-position aggregates for every ticker come out of a single pass of grouped reductions, which is what
+Portfolio uses to compute its metrics.
+"""
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+from position import Position
+from transaction import Transaction
+
+
+class TransactionStore:
+    """Transactions for many securities held as columns."""
+
+    def __init__(self):
+        self.symbols = np.empty(0, dtype=object)
+        self.codes = np.empty(0, dtype=np.int32)
+        self.dates = np.empty(0, dtype="datetime64[ns]")
+        self.prices = np.empty(0, dtype=np.float64)
+        self.quantities = np.empty(0, dtype=np.float64)
+        self.revision = 0
+        self._aggregates = None
+        self._aggregates_revision = None
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame):
+        """Build a store from a DataFrame with Ticker, Date, Price and Quantity columns."""
+        store = cls()
+        store.append(frame["Ticker"], frame["Date"], frame["Price"], frame["Quantity"])
+        return store
+
+    @classmethod
+    def from_arrays(cls, symbols, codes, dates, prices, quantities):
+        """Wrap existing columns without copying them, e.g. memory-mapped arrays from a snapshot."""
+        store = cls()
+        store.symbols = np.asarray(symbols, dtype=object)
+        store.codes = codes
+        store.dates = dates
+        store.prices = prices
+        store.quantities = quantities
+        store.revision = 1
+        return store
+
+    @classmethod
+    def from_positions(cls, positions: Dict[str, Position]):
+        """Build a store from position objects."""
+        store = cls()
+        store.extend_positions(positions.values())
+        return store
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, tickers, dates, prices, quantities):
+        """Append columns of transactions. All four arguments are sequences of the same length."""
+        new_codes, uniques = pd.factorize(np.asarray(tickers, dtype=object))
+        if len(new_codes) == 0:
+            return
+
+        index = {symbol: code for code, symbol in enumerate(self.symbols)}
+        added = [symbol for symbol in uniques if symbol not in index]
+        if added:
+            index.update({symbol: len(index) + i for i, symbol in enumerate(added)})
+            self.symbols = np.concatenate([self.symbols, np.array(added, dtype=object)])
+        remap = np.array([index[symbol] for symbol in uniques], dtype=np.int32)
+
+        self.codes = np.concatenate([self.codes, remap[new_codes]])
+        self.dates = np.concatenate([self.dates, pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]")])
+        self.prices = np.concatenate([self.prices, np.asarray(prices, dtype=np.float64)])
+        self.quantities = np.concatenate([self.quantities, np.asarray(quantities, dtype=np.float64)])
+        self.revision += 1
+
+    def extend_positions(self, positions: Iterable[Position]):
+        """Append the transactions of position objects."""
+        transactions = [transaction for position in positions for transaction in position.transactions]
+        self.append([transaction.ticker for transaction in transactions],
+                    [transaction.date for transaction in transactions],
+                    [transaction.price for transaction in transactions],
+                    [transaction.quantity for transaction in transactions])
+
+    def aggregate(self) -> pd.DataFrame:
+        """Per-ticker totals, computed for every ticker in one pass.
+
+        Returns:
+            pd.DataFrame: Indexed by ticker, with quantity, cost_basis, buy_amount (the amount of all buys),
+            first_date, last_date and transactions (the row count).
+        """
+        if self._aggregates_revision == self.revision:
+            return self._aggregates
+
+        n = len(self.symbols)
+        amounts = self.prices * self.quantities
+        dates = self.dates.view(np.int64)
+        first = np.full(n, np.iinfo(np.int64).max)
+        last = np.full(n, np.iinfo(np.int64).min)
+        np.minimum.at(first, self.codes, dates)
+        np.maximum.at(last, self.codes, dates)
+
+        self._aggregates = pd.DataFrame({
+            "quantity": np.bincount(self.codes, weights=self.quantities, minlength=n),
+            "cost_basis": np.bincount(self.codes, weights=amounts, minlength=n),
+            "buy_amount": np.bincount(self.codes, weights=np.where(self.quantities > 0, amounts, 0), minlength=n),
+            "first_date": first.view("datetime64[ns]"),
+            "last_date": last.view("datetime64[ns]"),
+            "transactions": np.bincount(self.codes, minlength=n),
+        }, index=pd.Index(self.symbols, name="Ticker"))
+        self._aggregates_revision = self.revision
+        return self._aggregates
+
+    def tickers(self):
+        return list(self.symbols)
+
+    def position(self, ticker) -> Position:
+        """Materialize the transactions of one ticker as a Position."""
+        code = np.flatnonzero(self.symbols == ticker)
+        rows = np.flatnonzero(self.codes == code[0]) if len(code) else []
+        return Position(ticker, [Transaction(ticker, pd.Timestamp(self.dates[i]), self.prices[i], self.quantities[i])
+                                 for i in rows])
+
+    def to_positions(self) -> Dict[str, Position]:
+        return {ticker: self.position(ticker) for ticker in self.symbols}
+
+
+class AggregateStore:
+    """Per-ticker running totals without the transactions behind them.
+
+    Stands in for a TransactionStore where the transactions themselves do not fit in memory. Batches of transactions
+    are folded in as they arrive and then dropped, so memory grows with the number of tickers rather than rows.
+    """
+
+    def __init__(self):
+        self.revision = 0
+        self._aggregates = TransactionStore().aggregate()
+
+    def __len__(self):
+        return int(self._aggregates["transactions"].sum())
+
+    def fold(self, frame: pd.DataFrame):
+        """Fold a DataFrame with Ticker, Date, Price and Quantity columns into the totals."""
+        self.fold_aggregates(TransactionStore.from_frame(frame).aggregate())
+
+    def fold_aggregates(self, aggregates: pd.DataFrame):
+        """Fold the output of TransactionStore.aggregate (or of another AggregateStore) into the totals."""
+        if len(self._aggregates) == 0:
+            self._aggregates = aggregates.copy()
+        else:
+            self._aggregates = pd.concat([self._aggregates, aggregates]).groupby(level=0, sort=False).agg({
+                "quantity": "sum",
+                "cost_basis": "sum",
+                "buy_amount": "sum",
+                "first_date": "min",
+                "last_date": "max",
+                "transactions": "sum",
+            })
+        self.revision += 1
+
+    def extend_positions(self, positions: Iterable[Position]):
+        store = TransactionStore()
+        store.extend_positions(positions)
+        self.fold_aggregates(store.aggregate())
+
+    def aggregate(self) -> pd.DataFrame:
+        return self._aggregates
+
+    def tickers(self):
+        return list(self._aggregates.index)
@@ -0,0 +1,115 @@
+"""valuation.py - Daily portfolio value, cost basis and P&L over the whole holding history.
+
+Holdings by date come from cumulative sums: each transaction adds its quantity (and amount) to one cell of a
+(dates x tickers) grid, and a cumulative sum down the dates turns those flows into positions held at the end of each
+day. Multiplying by a price matrix aligned on the same grid values every ticker on every date in one operation.
+
+Prices come from the bar store, carried forward over days without a bar. Where a ticker has no bar yet (or none at
+all, say a delisted security), the price of its latest transaction stands in.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from DataSources.store import CachedDataSource
+from transaction_store import TransactionStore
+
+# The periods of whole years yfinance accepts.
+YEAR_PERIODS = (1, 2, 5, 10)
+
+
+def date_grid(store: TransactionStore, start=None, end=None, freq="D") -> pd.DatetimeIndex:
+    """The dates to value on: from the first transaction (or start) to today (or end)."""
+    start = pd.Timestamp(start if start is not None else store.dates.min()).normalize()
+    end = pd.Timestamp(end if end is not None else pd.Timestamp.now()).normalize()
+    return pd.date_range(start, end, freq=freq, name="Date")
+
+
+def _rows(store: TransactionStore, dates: pd.DatetimeIndex) -> np.ndarray:
+    """The grid row each transaction lands on: the first date on or after its own.
+
+    Transactions before the grid land on its first date, and those after it on len(dates).
+    """
+    return np.searchsorted(dates.to_numpy(), store.dates.astype("datetime64[D]").astype("datetime64[ns]"))
+
+
+def _grid(store: TransactionStore, dates: pd.DatetimeIndex, values) -> np.ndarray:
+    """Sum values into a (dates x tickers) grid by the row each transaction lands on."""
+    rows = _rows(store, dates)
+    inside = rows < len(dates)
+    grid = np.zeros((len(dates), len(store.symbols)))
+    np.add.at(grid, (rows[inside], store.codes[inside]), values[inside])
+    return grid
+
+
+def holdings(store: TransactionStore, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """Quantity held of every ticker at the end of every date."""
+    return pd.DataFrame(_grid(store, dates, store.quantities).cumsum(axis=0), index=dates,
+                        columns=pd.Index(store.symbols, name="Ticker"))
+
+
+def trade_prices(store: TransactionStore, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """The price of the latest transaction of every ticker as of every date, NaN before its first one."""
+    trades = pd.DataFrame({"row": _rows(store, dates), "code": store.codes, "date": store.dates, "price": store.prices})
+    trades = trades[trades["row"] < len(dates)].sort_values("date", kind="stable")
+    trades = trades.drop_duplicates(["row", "code"], keep="last")
+
+    grid = np.full((len(dates), len(store.symbols)), np.nan)
+    grid[trades["row"].to_numpy(), trades["code"].to_numpy()] = trades["price"].to_numpy()
+    return pd.DataFrame(grid, index=dates, columns=pd.Index(store.symbols, name="Ticker")).ffill()
+
+
+def value_history(store: TransactionStore, prices: pd.DataFrame, start=None, end=None, freq="D") -> pd.DataFrame:
+    """Daily value, cost basis and P&L of everything in the store.
+
+    Args:
+        store (TransactionStore): The transactions to value.
+        prices (pd.DataFrame): Closing prices indexed by date, one column per ticker, e.g. from BarStore.load_panel.
+        start, end (optional): The first and last dates to value on. Default to the first transaction and today.
+        freq (str, optional): The spacing of the dates. Defaults to every calendar day.
+
+    Returns:
+        pd.DataFrame: Indexed by Date, with value (market value of what is held), cost_basis (the net amount paid so
+        far, as in Portfolio.cost_basis), gain_loss (value less cost basis, so realized plus unrealized) and drawdown
+        (the fall in value from its running peak, as a fraction).
+    """
+    if not isinstance(store, TransactionStore):
+        raise TypeError("A value history needs the transactions themselves, not just per-ticker totals.")
+
+    dates = date_grid(store, start, end, freq)
+    symbols = pd.Index(store.symbols, name="Ticker")
+    quantity = holdings(store, dates).to_numpy()
+    cost_basis = _grid(store, dates, store.prices * store.quantities).cumsum(axis=0).sum(axis=1)
+
+    # Bars from before the grid still count as the last price going into it.
+    aligned = prices.reindex(columns=symbols).sort_index()
+    aligned = aligned.reindex(aligned.index.union(dates)).ffill().reindex(dates)
+    price = aligned.fillna(trade_prices(store, dates)).to_numpy()
+
+    value = np.nansum(quantity * price, axis=1)
+    peak = np.fmax.accumulate(value)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = np.where(peak > 0, value / peak - 1, 0.0)
+
+    return pd.DataFrame({
+        "value": value,
+        "cost_basis": cost_basis,
+        "gain_loss": value - cost_basis,
+        "drawdown": drawdown,
+    }, index=dates)
+
+
+def portfolio_history(store: TransactionStore, source: CachedDataSource, start=None, end=None, freq="D"):
+    """Daily value history of a store, with prices from a CachedDataSource's bar store.
+
+    Bars are brought up to date first, going back far enough to cover the first transaction.
+    """
+    tickers = list(store.symbols)
+    first = pd.Timestamp(start if start is not None else store.dates.min())
+    years = max(1, math.ceil((pd.Timestamp.now() - first).days / 365))
+    # yfinance only takes some periods, so round up to the next one it does.
+    period = next((f"{period}y" for period in YEAR_PERIODS if years <= period), "max")
+    source.refresh(tickers, period=period)
+    prices = source.store.load_panel(source.name, tickers, source.interval)
+    return value_history(store, prices, start, end, freq)
@@ -0,0 +1,99 @@
+"""watch.py - Keep a portfolio in memory and alert as prices cross their ATR trailing stops.
+
+The portfolio is loaded once. Price updates then arrive from IDataSource.stream_prices, which polls (Yahoo) or is
+pushed over a websocket (Kraken), and each update only touches the tickers it carries: their price is set on the
+portfolio and compared against stop levels held in a dict. Stop levels are refreshed from the indicator state once per
+new day rather than on every update.
+"""
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from DataSources.IDataSource import IDataSource
+from indicators import TrailingStops
+from portfolio import Portfolio
+
+Alert = namedtuple("Alert", "ticker kind price level value latency")
+
+BELOW_STOP = "below stop"
+ABOVE_TARGET = "above target"
+
+
+def print_alert(alert: Alert):
+    print(f"{alert.ticker} {alert.kind}: {alert.price:.2f} crossed {alert.level:.2f} "
+          f"(position value ${alert.value:.2f}, {alert.latency * 1000:.2f} ms after the update)")
+
+
+class Watcher:
+    """Watches the open positions of a portfolio and emits an Alert each time a price crosses a stop level.
+
+    A price below Close_Minus_ATR_15 crosses the stop, and a price above Close_Plus_ATR_3 the target. An alert fires
+    once on crossing and again only after the price has come back inside the band.
+    """
+
+    def __init__(self, portfolio: Portfolio, source: IDataSource, stops: TrailingStops, interval=60,
+                 alert: Callable[[Alert], None] = print_alert):
+        self.portfolio = portfolio
+        self.source = source
+        self.stops = stops
+        self.interval = interval
+        self.alert = alert
+        self.levels: Dict[str, tuple] = {}
+        self.quantities: Dict[str, float] = {}
+        self._sides: Dict[str, str] = {}
+        self._levels_date = None
+
+    def tickers(self) -> List[str]:
+        """The tickers of open positions."""
+        aggregates = self.portfolio.store.aggregate()
+        return list(aggregates.index[aggregates["quantity"] > 0])
+
+    def refresh_levels(self):
+        """Bring the stop levels up to date with the latest bars."""
+        tickers = self.tickers()
+        stops = self.stops.refresh(tickers).dropna(subset=["ATR"])
+        self.levels = dict(zip(stops.index, zip(stops["Close_Minus_ATR_15"], stops["Close_Plus_ATR_3"])))
+        self.quantities = self.portfolio.store.aggregate()["quantity"].reindex(tickers).to_dict()
+        self._levels_date = pd.Timestamp.now().normalize()
+
+    def check(self, prices: Dict[str, float], received=None) -> List[Alert]:
+        """Apply a price update and return the alerts it triggers. Only the tickers in the update are looked at."""
+        received = received or time.perf_counter()
+        self.portfolio.update_prices(prices)
+        alerts = []
+        for ticker, price in prices.items():
+            if ticker not in self.levels:
+                continue
+            lower, upper = self.levels[ticker]
+            side = BELOW_STOP if price < lower else ABOVE_TARGET if price > upper else None
+            if side and side != self._sides.get(ticker):
+                level = lower if side == BELOW_STOP else upper
+                alerts.append(Alert(ticker, side, price, level, price * self.quantities.get(ticker, 0.0),
+                                    time.perf_counter() - received))
+            self._sides[ticker] = side
+        return alerts
+
+    def run(self, stop: threading.Event = None):
+        """Watch until stopped. The stream is opened again whenever the tickers with stop levels change."""
+        stop = stop or threading.Event()
+        self.refresh_levels()
+        print(f"Watching {len(self.levels)} positions...")
+        while not stop.is_set():
+            watched = list(self.levels)
+            stream = self.source.stream_prices(watched, self.interval, stop)
+            try:
+                for prices in stream:
+                    received = time.perf_counter()
+                    if pd.Timestamp.now().normalize() != self._levels_date:
+                        self.refresh_levels()
+                    for alert in self.check(prices, received):
+                        self.alert(alert)
+                    if self.levels.keys() != set(watched):
+                        break
+                else:
+                    return  # the stream ended
+            finally:
+                stream.close()